@@ -0,0 +1,24 @@
+import shutil
+
+import pytest
+
+from yatube.test_runner import temp_cache_settings
+
+
+def pytest_sessionstart(session):
+    # Как и в manage.py test, рабочий кэш из BASE_DIR/cache не трогаем.
+    # Фикстура не годится: сбор тестов уже обращается к django cache.
+    session.cache_settings, session.cache_location = temp_cache_settings()
+    session.cache_settings.enable()
+
+
+def pytest_sessionfinish(session):
+    session.cache_settings.disable()
+    shutil.rmtree(session.cache_location, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def build_thumbnails_inline(settings):
+    # Тестовая SQLite в памяти блокирует таблицы целиком: поток пула
+    # миниатюр, пишущий в KV-хранилище, ронял бы следующий запрос теста.
+    settings.THUMBNAIL_WORKERS = 0
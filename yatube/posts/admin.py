@@ -1,17 +1,137 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
 
+from . import search
 from .models import Comment, Follow, Group, Post
+from .paginators import (EstimatedCountPaginator, decode_cursor,
+                         encode_cursor, past)
 
+CURSOR_VAR = 'after'
 
-class PostAdmin(admin.ModelAdmin):
+
+class KeysetChangeList(ChangeList):
+    """Список, который по ?after=<курсор> продолжает выборку за последней
+    показанной строкой: условие по индексу вместо OFFSET, поэтому дальняя
+    страница стоит столько же, сколько первая.
+
+    keyset модели админки — поле даты (курсор по паре с pk) или сам pk.
+    Курсор работает только при сортировке по убыванию keyset; при другой
+    сортировке он игнорируется.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = None
+        self.keyset = False
+        self.next_url = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Новая сортировка или фильтр начинают выборку сначала, номера
+        # страниц отсчитываются от курсора.
+        if set(new_params or ()) - {PAGE_VAR}:
+            remove = [*(remove or ()), CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        key = self.model_admin.keyset
+        token = request.GET.get(CURSOR_VAR)
+        if key == 'pk':
+            self.keyset = tuple(queryset.query.order_by) == ('-pk',)
+            self.cursor = int(token) if token and token.isdigit() else None
+            if self.keyset and self.cursor:
+                queryset = queryset.filter(pk__lt=self.cursor)
+            return queryset
+        self.keyset = tuple(queryset.query.order_by) == (f'-{key}', '-pk')
+        self.cursor = decode_cursor(token)
+        if self.keyset and self.cursor:
+            queryset = queryset.filter(past(self.cursor, key))
+        return queryset
+
+    def get_results(self, request):
+        super().get_results(request)
+        if not self.keyset or not self.multi_page or self.show_all:
+            return
+        # Список вычисляется один раз: шаблон и формы берут его из кэша.
+        rows = list(self.result_list)
+        if len(rows) == self.list_per_page:
+            self.next_url = self.get_query_string(
+                {CURSOR_VAR: self.cursor_for(rows[-1])}, [PAGE_VAR]
+            )
+
+    def cursor_for(self, obj):
+        key = self.model_admin.keyset
+        if key == 'pk':
+            return str(obj.pk)
+        return encode_cursor(getattr(obj, key), obj.pk)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Админка большой таблицы: вместо точного COUNT(*) примерный
+    счётчик, вместо OFFSET курсор по keyset (по умолчанию pk), варианты
+    выбора в редактируемых колонках списка загружаются один раз на
+    страницу, а не на каждую строку."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    keyset = 'pk'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name in self.list_editable:
+            # Копии поля в формах строк получают готовый список.
+            formfield.choices = list(formfield.choices)
+        return formfield
+
+
+class PostAdmin(LargeTableAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    raw_id_fields = ('author',)
     empty_value_display = '-пусто-'
+    keyset = 'pub_date'
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=Post.EDIT_FIELDS)
+        else:
+            obj.save()
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по text идёт через индекс FTS5, а не LIKE '%...%'.
+        if search.available() and search.match_query(search_term):
+            return queryset.filter(
+                pk__in=search.matching_ids(search_term)
+            ), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('author', 'post')
+
+
+class FollowAdmin(LargeTableAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
-admin.site.register(Comment)
-admin.site.register(Follow)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
@@ -0,0 +1,313 @@
+"""Автодополнение авторов и групп по префиксу без запросов к базе.
+
+Индекс живёт в памяти процесса: отсортированный список ключей —
+username, имя и фамилия в обоих порядках, название и slug группы в
+нижнем регистре. Префикс находится двумя bisect, из совпадений
+берутся AUTOCOMPLETE_LIMIT целей с наибольшим числом постов; для
+префиксов до SHORT_PREFIX букв совпадения упорядочены заранее. В индекс
+попадают AUTOCOMPLETE_SIZE самых активных авторов и столько же групп.
+
+Сигналы правят индекс своего процесса на месте под _lock и, если
+сменились индексируемые поля, поднимают тег «autocomplete» в общем кэше
+(posts.caching); другой процесс, увидев новую версию тега,
+перестраивает индекс при следующем запросе. Число постов сдвигается
+только в своём процессе и освежается полной перестройкой раз в
+AUTOCOMPLETE_TTL секунд.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.db.models import Count
+from django.urls import reverse
+
+from . import caching
+from .models import Group, User
+
+TAG = 'autocomplete'
+# Больше любого символа: (префикс + END) ограничивает диапазон сверху.
+END = '\U0010ffff'
+CACHE_SIZE = 1024
+# Префиксы до этой длины отвечают из заранее упорядоченных корзин.
+SHORT_PREFIX = 3
+
+_lock = threading.Lock()
+_index = None
+_version = None
+_built = 0
+_building = False
+
+
+def normalize(text):
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+def user_keys(username, first_name, last_name):
+    return (
+        username,
+        f'{first_name} {last_name}',
+        f'{last_name} {first_name}',
+    )
+
+
+class PrefixIndex:
+    """Отсортированный массив ключей для поиска по префиксу.
+
+    Ключи и их цели лежат в двух параллельных списках. Для префиксов не
+    длиннее SHORT_PREFIX цели заранее разложены по корзинам,
+    упорядоченным по числу постов: на одну-три буквы подходят тысячи
+    ключей, и вместо перебора диапазона ответ берётся из начала корзины.
+    Длинные префиксы перебирают свой небольшой диапазон массива.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._key_targets = []
+        self._targets = {}
+        self._target_keys = {}
+        self._short = {}
+        self._results = {}
+
+    def load(self, entries):
+        """Заполняет пустой индекс целями (target, keys, label, name,
+        posts): одна сортировка в конце вместо вставки по одной."""
+        ranked = []
+        for target, keys, label, name, posts in entries:
+            self._register(target, keys, label, name, posts)
+            ranked.append((self._rank(target), target))
+        # Цели идут по убыванию числа постов, поэтому корзины коротких
+        # префиксов получаются уже упорядоченными.
+        ranked.sort()
+        keys = []
+        targets = []
+        for item in ranked:
+            target_keys = self._target_keys[item[1]]
+            keys.extend(target_keys)
+            targets.extend([item[1]] * len(target_keys))
+            for prefix in _short_prefixes(target_keys):
+                self._short.setdefault(prefix, []).append(item)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [keys[position] for position in order]
+        self._key_targets = [targets[position] for position in order]
+        self._results.clear()
+
+    def add(self, target, keys, label, name, posts=None):
+        """Добавляет цель ('author' или 'group', id) или заменяет её.
+
+        name — username или slug для ссылки; posts=None сохраняет прежнее
+        число постов цели.
+        """
+        if posts is None:
+            posts = self._targets.get(target, {}).get('posts', 0)
+        self.remove(target)
+        for key in self._register(target, keys, label, name, posts):
+            position = bisect_right(self._keys, key)
+            self._keys.insert(position, key)
+            self._key_targets.insert(position, target)
+        self._insert_ranked(target)
+        self._results.clear()
+
+    def remove(self, target):
+        if target not in self._targets:
+            return
+        self._remove_ranked(target)
+        for key in self._target_keys.pop(target):
+            position = bisect_left(self._keys, key)
+            while self._key_targets[position] != target:
+                position += 1
+            del self._keys[position]
+            del self._key_targets[position]
+        del self._targets[target]
+        self._results.clear()
+
+    def shift(self, target, delta):
+        if target in self._targets:
+            self._remove_ranked(target)
+            self._targets[target]['posts'] += delta
+            self._insert_ranked(target)
+            self._results.clear()
+
+    def lookup(self, prefix, limit):
+        """До limit целей, у которых ключ начинается с prefix."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = self._results.get((prefix, limit))
+        if found is None:
+            if len(prefix) <= SHORT_PREFIX:
+                bucket = self._short.get(prefix, ())
+                found = [target for _, target in bucket[:limit]]
+            else:
+                start = bisect_left(self._keys, prefix)
+                stop = bisect_left(self._keys, prefix + END, start)
+                targets = set(self._key_targets[start:stop])
+                found = heapq.nsmallest(limit, targets, key=self._rank)
+            if len(self._results) >= CACHE_SIZE:
+                self._results.clear()
+            self._results[(prefix, limit)] = found
+        return [(target, dict(self._targets[target])) for target in found]
+
+    def _register(self, target, keys, label, name, posts):
+        keys = sorted({normalize(key) for key in keys if key.strip()})
+        self._targets[target] = {
+            'label': label, 'name': name, 'posts': posts,
+        }
+        self._target_keys[target] = keys
+        return keys
+
+    def _insert_ranked(self, target):
+        item = (self._rank(target), target)
+        for prefix in _short_prefixes(self._target_keys[target]):
+            insort(self._short.setdefault(prefix, []), item)
+
+    def _remove_ranked(self, target):
+        item = (self._rank(target), target)
+        for prefix in _short_prefixes(self._target_keys[target]):
+            bucket = self._short[prefix]
+            del bucket[bisect_left(bucket, item)]
+            if not bucket:
+                del self._short[prefix]
+
+    def _rank(self, target):
+        entry = self._targets[target]
+        return -entry['posts'], entry['label'], target
+
+    def __len__(self):
+        return len(self._targets)
+
+
+def _short_prefixes(keys):
+    return {
+        key[:length]
+        for length in range(1, SHORT_PREFIX + 1)
+        for key in keys
+    }
+
+
+def build():
+    size = settings.AUTOCOMPLETE_SIZE
+    authors = User.objects.annotate(n=Count('posts')).order_by(
+        '-n', 'pk'
+    ).values_list('pk', 'username', 'first_name', 'last_name', 'n')
+    groups = Group.objects.annotate(n=Count('posts')).order_by(
+        '-n', 'pk'
+    ).values_list('pk', 'title', 'slug', 'n')
+    entries = [
+        (
+            ('author', pk),
+            user_keys(username, first_name, last_name),
+            f'{first_name} {last_name}'.strip() or username,
+            username,
+            posts,
+        )
+        for pk, username, first_name, last_name, posts in authors[:size]
+    ]
+    entries.extend(
+        (('group', pk), (title, slug), title, slug, posts)
+        for pk, title, slug, posts in groups[:size]
+    )
+    index = PrefixIndex()
+    index.load(entries)
+    return index
+
+
+def current():
+    """Индекс процесса, перестроенный, если он устарел.
+
+    Перестраивает один поток и без блокировки: остальные тем временем
+    отвечают по старому индексу. Правка, пришедшая во время перестройки,
+    поднимет версию тега, и следующий запрос перестроит индекс снова.
+    """
+    global _index, _version, _built, _building
+    version = caching.tag_versions([TAG])[TAG]
+    with _lock:
+        expired = time.monotonic() - _built > settings.AUTOCOMPLETE_TTL
+        stale = _index is None or version != _version or expired
+        if not stale or (_building and _index is not None):
+            return _index
+        _building = True
+    try:
+        index = build()
+    finally:
+        with _lock:
+            _building = False
+    with _lock:
+        _index, _version, _built = index, version, time.monotonic()
+        return _index
+
+
+def _edit(change):
+    """Правит индекс процесса и сообщает о правке остальным процессам."""
+    global _version
+    before = caching.tag_versions([TAG])[TAG]
+    after = caching.bump(TAG)
+    with _lock:
+        if _index is None:
+            return
+        change(_index)
+        # Если индекс уже отставал от чужой правки, пусть перестроится.
+        if before == _version:
+            _version = after
+
+
+def update_user(user):
+    label = user.get_full_name() or user.username
+    _edit(lambda index: index.add(
+        ('author', user.pk),
+        user_keys(user.username, user.first_name, user.last_name),
+        label,
+        user.username,
+    ))
+
+
+def update_group(group):
+    _edit(lambda index: index.add(
+        ('group', group.pk), (group.title, group.slug), group.title,
+        group.slug,
+    ))
+
+
+def remove(kind, pk):
+    _edit(lambda index: index.remove((kind, pk)))
+
+
+def _shift(*changes):
+    """Сдвигает число постов только в индексе своего процесса."""
+    with _lock:
+        if _index is None:
+            return
+        for target, delta in changes:
+            if target[1] is not None:
+                _index.shift(target, delta)
+
+
+def shift_post(author_id, group_id, delta):
+    _shift((('author', author_id), delta), (('group', group_id), delta))
+
+
+def move_post(old_group_id, new_group_id):
+    _shift((('group', old_group_id), -1), (('group', new_group_id), 1))
+
+
+def suggest(prefix, limit=None):
+    """Подсказки для префикса: тип, подпись, ссылка и число постов."""
+    results = []
+    index = current()
+    # Сигналы правят индекс на месте под _lock: без него поиск мог бы
+    # застать списки ключей и целей посреди вставки.
+    with _lock:
+        found = index.lookup(prefix, limit or settings.AUTOCOMPLETE_LIMIT)
+    for (kind, pk), entry in found:
+        if kind == 'author':
+            url = reverse('posts:profile', args=(entry['name'],))
+        else:
+            url = reverse('posts:group_list', args=(entry['name'],))
+        results.append({
+            'kind': kind,
+            'label': entry['label'],
+            'url': url,
+            'posts': entry['posts'],
+        })
+    return results
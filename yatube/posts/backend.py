@@ -0,0 +1,38 @@
+"""Бэкенд миниатюр sorl с именем миниатюры без её построения.
+
+sorl вычисляет имя файла миниатюры (и ключ в KV-хранилище) только внутри
+get_thumbnail, которая заодно строит недостающий файл. Лента и варианты
+картинок ищут готовые миниатюры пачкой, поэтому им нужно одно имя:
+thumbnail_file() дополняет опции так же, как get_thumbnail, и берёт имя
+из того же метода бэкенда. Бэкенд подключается настройкой
+THUMBNAIL_BACKEND — это точка расширения sorl.
+"""
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    def full_options(self, source, options):
+        """Опции, с которыми get_thumbnail назовёт миниатюру source."""
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry, options):
+        """Миниатюра file_ под тем именем, которое даст ей get_thumbnail;
+        сам файл может ещё не существовать."""
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry, self.full_options(source, options)
+        )
+        return ImageFile(name, default.storage)
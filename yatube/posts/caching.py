@@ -0,0 +1,167 @@
+"""Кэш страниц с инвалидацией по тегам.
+
+Страница кэшируется вместе с версиями тегов, от которых она зависит
+(«posts», «post:<id>», «author:<id>», «group:<id>»). Запись в Post,
+Comment, Follow, Group или User поднимает версии своих тегов, и
+зависящие от них страницы перестают совпадать без ожидания таймаута.
+Версия тега — время последнего изменения.
+
+Версии и страницы хранятся в общем для процессов кэше
+(CACHES['default']), поэтому поднятая одним воркером версия сразу видна
+остальным.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+TAG_PREFIX = 'tag:'
+PAGE_PREFIX = 'tagged_page:'
+COUNTER_PREFIX = 'tagged_cache:'
+COUNTER_EVENTS = ('hit', 'miss', 'stale')
+
+
+def post_tags(post):
+    tags = {f'post:{post.pk}', f'author:{post.author_id}'}
+    if post.group_id is not None:
+        tags.add(f'group:{post.group_id}')
+    return tags
+
+
+def page_tags(page):
+    tags = set()
+    for post in page:
+        tags |= post_tags(post)
+    return tags
+
+
+def tag_versions(tags, missing_version=None):
+    """Текущие версии тегов.
+
+    Отсутствующим (новым или вытесненным) тегам назначается
+    missing_version, по умолчанию «сейчас»: страница, закэшированная при
+    прежней версии, с новой уже не совпадёт.
+    """
+    keys = [TAG_PREFIX + tag for tag in tags]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        if missing_version is None:
+            missing_version = time.time()
+        for key in missing:
+            cache.add(key, missing_version, None)
+        found.update(cache.get_many(missing))
+    return {key[len(TAG_PREFIX):]: version for key, version in found.items()}
+
+
+def bump(*tags):
+    """Поднимает версии тегов; возвращает новую версию."""
+    now = time.time()
+    cache.set_many({TAG_PREFIX + tag: now for tag in tags}, None)
+    return now
+
+
+def add_cache_tags(request, *tags):
+    """Отмечает теги, от которых зависит формируемая страница."""
+    request._cache_tags = getattr(request, '_cache_tags', set()) | set(tags)
+
+
+def page_key(request):
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    raw = f'{request.get_full_path()}|{user_id}'.encode()
+    return PAGE_PREFIX + hashlib.md5(raw).hexdigest()
+
+
+def count_event(event, prefix=COUNTER_PREFIX, delta=1):
+    key = f'{prefix}{event}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Счётчик вытеснили между add и incr: потеря одного события
+        # не стоит ещё одного обращения к кэшу.
+        pass
+
+
+def cache_counters(prefix=COUNTER_PREFIX, events=COUNTER_EVENTS):
+    """Сколько раз страницы отдавались из кэша, строились заново и
+    отдавались устаревшими, пока их пересчитывал другой воркер; счётчики
+    лежат в общем кэше и суммируют все процессы.
+
+    С другими prefix и events читает счётчики, заведённые через
+    count_event, например счётчики миниатюр.
+    """
+    keys = [f'{prefix}{event}' for event in events]
+    found = cache.get_many(keys)
+    return {
+        event: found.get(key, 0)
+        for event, key in zip(events, keys)
+    }
+
+
+def cache_tagged(soft_ttl=None, hard_ttl=None):
+    """Декоратор представления: кэширует ответ по тегам, отмеченным через
+    add_cache_tags.
+
+    Запись свежая, пока не прошёл soft_ttl и не сменилась версия ни одного
+    тега. Устаревшую запись пересчитывает ровно один воркер — тот, кто
+    взял блокировку в общем кэше (cache.add атомарен и между процессами);
+    остальные до конца пересчёта отдают старый ответ.
+    Через hard_ttl запись удаляется из кэша совсем. По умолчанию TTL
+    берутся из TAGGED_CACHE_SOFT_TTL и TAGGED_CACHE_HARD_TTL.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_key(request)
+            lock_key = f'{key}:lock'
+            entry = cache.get(key)
+            locked = False
+            if entry is None:
+                count_event('miss')
+            else:
+                versions, response, fresh_until = entry
+                if (time.time() < fresh_until
+                        and tag_versions(versions) == versions):
+                    count_event('hit')
+                    return response
+                locked = cache.add(
+                    lock_key, True, settings.TAGGED_CACHE_LOCK_TIMEOUT
+                )
+                if not locked:
+                    count_event('stale')
+                    return response
+                count_event('miss')
+            try:
+                return _render_and_store(
+                    view, request, args, kwargs, key,
+                    soft_ttl or settings.TAGGED_CACHE_SOFT_TTL,
+                    hard_ttl or settings.TAGGED_CACHE_HARD_TTL,
+                )
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+        return wrapper
+    return decorator
+
+
+def _render_and_store(view, request, args, kwargs, key, soft_ttl, hard_ttl):
+    started = time.time()
+    request._cache_tags = set()
+    response = view(request, *args, **kwargs)
+    if response.status_code != 200 or not request._cache_tags:
+        return response
+    if request.user.is_authenticated:
+        # В шапке страницы имя того, для кого она построена.
+        request._cache_tags.add(f'author:{request.user.pk}')
+    # Новые теги получают версию начала рендера, поэтому первая же
+    # страница с ними попадает в кэш. Если теги сменились, пока страница
+    # строилась, она может содержать устаревшие данные: такую не кэшируем.
+    versions = tag_versions(request._cache_tags, started)
+    if max(versions.values()) <= started:
+        cache.set(key, (versions, response, started + soft_ttl), hard_ttl)
+    return response
@@ -0,0 +1,126 @@
+"""Условные GET для лент и страницы поста.
+
+Валидаторы считаются до тяжёлого запроса страницы: версии тегов из
+общего для процессов кэша posts.caching (меняются при любой записи, от
+которой зависит страница, в каком бы воркере она ни случилась) плюс
+(pub_date, id) самого свежего поста ленты, читаемые по индексу. Если
+клиент или прокси прислал совпадающие If-None-Match/If-Modified-Since,
+ответ 304 отдаётся без ORM-запросов ленты и без рендера шаблона.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .caching import tag_versions
+from .models import Group, Post, User
+
+VALIDATORS_ATTR = '_conditional_validators'
+
+
+def _latest(queryset):
+    """(id, pub_date) самого свежего поста одним шагом по индексу."""
+    return queryset.order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date'
+    ).first() or (None, None)
+
+
+def index_validators(request):
+    return {'posts'}, _latest(Post.objects.all())
+
+
+def group_validators(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is None:
+        return None
+    return (
+        {f'group:{group_id}'},
+        _latest(Post.objects.filter(group_id=group_id)),
+    )
+
+
+def profile_validators(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    return (
+        {f'author:{author_id}'},
+        _latest(Post.objects.filter(author_id=author_id)),
+    )
+
+
+def post_validators(request, post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id', 'pub_date'
+    ).first()
+    if row is None:
+        return None
+    author_id, group_id, pub_date = row
+    tags = {f'post:{post_id}', f'author:{author_id}'}
+    if group_id is not None:
+        tags.add(f'group:{group_id}')
+    return tags, (post_id, pub_date)
+
+
+def _last_modified(moment):
+    """Last-Modified для изменения в moment или None.
+
+    В HTTP-дате нет долей секунды: клиент, получивший её в ту же
+    секунду, что и изменение, не отличил бы следующее изменение той же
+    секунды. Поэтому пока секунда не закончилась, отдаётся только ETag.
+    """
+    now = timezone.now()
+    if moment.replace(microsecond=0) >= now.replace(microsecond=0):
+        return None
+    return moment
+
+
+def _validators(request, compute, kwargs):
+    """Один раз на запрос считает пару (etag, last_modified)."""
+    if not hasattr(request, VALIDATORS_ATTR):
+        result = compute(request, **kwargs)
+        validators = (None, None)
+        if result is not None:
+            tags, facts = result
+            versions = tag_versions(tags)
+            user_id = request.user.pk if request.user.is_authenticated else 0
+            raw = '|'.join([
+                request.get_full_path(),
+                str(user_id),
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+                *sorted(f'{tag}={versions[tag]}' for tag in versions),
+                *map(str, facts),
+            ])
+            moments = [
+                datetime.datetime.fromtimestamp(version, timezone.utc)
+                for version in versions.values()
+            ]
+            moments.extend(
+                fact for fact in facts
+                if isinstance(fact, datetime.datetime)
+            )
+            validators = (
+                hashlib.md5(raw.encode()).hexdigest(),
+                _last_modified(max(moments)),
+            )
+        setattr(request, VALIDATORS_ATTR, validators)
+    return getattr(request, VALIDATORS_ATTR)
+
+
+def conditional(compute):
+    """Декоратор представления: ETag и Last-Modified из compute(request,
+    **kwargs), который возвращает (теги, факты) или None, если объекта нет.
+    """
+    def etag(request, *args, **kwargs):
+        return _validators(request, compute, kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return _validators(request, compute, kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
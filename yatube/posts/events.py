@@ -0,0 +1,150 @@
+"""Поток новых комментариев поста в формате Server-Sent Events.
+
+Поток отдаёт комментарии запросом `id > последний отданный` по индексу
+post_id (SQLite хранит в нём и id, так что сортировка не нужна) и
+засыпает на шине процесса (CommentBus) до нового комментария к посту или
+до COMMENT_STREAM_HEARTBEAT секунд; по таймауту клиенту уходит пустое
+сообщение, чтобы прокси не рвали соединение. Комментарии, созданные
+в другом воркере, находит тот же запрос после пробуждения по таймауту.
+
+Каждый поток SSE занимает поток сервера, поэтому страница открывает его
+только по просьбе читателя, их не больше COMMENT_STREAMS_MAX на процесс
+(часть SERVER_THREADS), и каждый живёт не дольше COMMENT_STREAM_TIMEOUT:
+браузер переподключается сам и присылает Last-Event-ID, с которого
+поток продолжается. Соединение с базой на время ожидания закрывается.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.template.loader import render_to_string
+
+from .models import Comment
+
+# Через сколько миллисекунд браузеру переподключаться после обрыва.
+RETRY_MS = 3000
+BATCH_SIZE = 50
+
+_slots_lock = threading.Lock()
+_active = 0
+
+
+def acquire():
+    """Занимает место под поток; False, если мест нет."""
+    global _active
+    with _slots_lock:
+        if _active >= settings.COMMENT_STREAMS_MAX:
+            return False
+        _active += 1
+        return True
+
+
+def release():
+    global _active
+    with _slots_lock:
+        _active -= 1
+
+
+class CommentBus:
+    """Версии постов, которые кто-то слушает, и ожидание их смены."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions = {}
+        self._listeners = {}
+
+    def subscribe(self, post_id):
+        with self._condition:
+            self._versions.setdefault(post_id, 0)
+            self._listeners[post_id] = self._listeners.get(post_id, 0) + 1
+
+    def unsubscribe(self, post_id):
+        with self._condition:
+            self._listeners[post_id] -= 1
+            if not self._listeners[post_id]:
+                del self._listeners[post_id]
+                del self._versions[post_id]
+
+    def version(self, post_id):
+        with self._condition:
+            return self._versions.get(post_id, 0)
+
+    def notify(self, post_id):
+        with self._condition:
+            if post_id in self._versions:
+                self._versions[post_id] += 1
+                self._condition.notify_all()
+
+    def wait(self, post_id, seen, timeout):
+        """Ждёт смены версии поста; False, если вышел timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._versions.get(post_id, 0) != seen, timeout
+            )
+
+
+bus = CommentBus()
+
+
+def latest_id(post_id):
+    return Comment.objects.filter(post_id=post_id).order_by(
+        '-pk'
+    ).values_list('pk', flat=True).first() or 0
+
+
+def event(comment):
+    html = render_to_string(
+        'posts/includes/comment.html', {'comment': comment}
+    )
+    data = ''.join(f'data: {line}\n' for line in html.strip().splitlines())
+    return f'id: {comment.pk}\nevent: comment\n{data}\n'
+
+
+class CommentStream:
+    """Тело ответа потока; close() освобождает место, даже если сервер
+    закрыл ответ, не начав его читать."""
+
+    def __init__(self, post_id, last_seen):
+        self.post_id = post_id
+        self.last_seen = last_seen
+        self._closed = False
+
+    def __iter__(self):
+        bus.subscribe(self.post_id)
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            yield from self._events()
+        finally:
+            bus.unsubscribe(self.post_id)
+
+    def _events(self):
+        deadline = time.monotonic() + settings.COMMENT_STREAM_TIMEOUT
+        while True:
+            # Версию читаем до запроса: комментарий, пришедший между
+            # ними, разбудит ожидание, а не потеряется.
+            seen = bus.version(self.post_id)
+            comments = list(
+                Comment.objects.filter(
+                    post_id=self.post_id, pk__gt=self.last_seen
+                ).with_authors().order_by('pk')[:BATCH_SIZE]
+            )
+            for comment in comments:
+                self.last_seen = comment.pk
+                yield event(comment)
+            if len(comments) == BATCH_SIZE:
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            timeout = min(settings.COMMENT_STREAM_HEARTBEAT, remaining)
+            # Пока поток спит, соединение с базой ему не нужно.
+            if not connection.in_atomic_block:
+                connection.close()
+            if not bus.wait(self.post_id, seen, timeout):
+                yield ': heartbeat\n\n'
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            release()
@@ -0,0 +1,208 @@
+"""Лента «Избранные авторы»: гибрид push и pull.
+
+Посты обычных авторов раскладываются в TimelineEntry подписчиков при
+публикации (push). Авторы, у которых подписчиков не меньше
+FEED_CELEBRITY_THRESHOLD, считаются «знаменитостями»: их посты не
+копируются, а подмешиваются при чтении k-way слиянием отсортированных
+потоков по каждому такому автору (pull).
+
+Когда знаменитость теряет подписчиков и опускается ниже порога, чтение
+перестаёт подтягивать её посты, поэтому ленты подписчиков догоняются
+постами, которые не раскладывались, пока автор был знаменитостью.
+"""
+import heapq
+from bisect import bisect_left
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator, seek
+from .stats import user_stats
+
+FAN_OUT_BATCH_SIZE = 500
+
+
+def celebrity_threshold():
+    return settings.FEED_CELEBRITY_THRESHOLD
+
+
+def is_celebrity(author_id):
+    followers = user_stats(author_id).followers_count
+    return followers >= celebrity_threshold()
+
+
+def followed_celebrities(user):
+    """id знаменитостей, на которых подписан user."""
+    followed = Follow.objects.filter(user=user).values('author_id')
+    return list(
+        UserStats.objects.filter(
+            user_id__in=followed,
+            followers_count__gte=celebrity_threshold(),
+        ).values_list('user_id', flat=True)
+    )
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=FAN_OUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты подписчиков обычного автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    _bulk_insert([
+        TimelineEntry(
+            user_id=user_id,
+            author_id=post.author_id,
+            post_id=post.pk,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers.iterator()
+    ])
+
+
+def backfill_follow(user_id, author_id):
+    """Добавляет в ленту читателя уже опубликованные посты автора.
+
+    Посты знаменитостей подтягиваются при чтении, их копировать незачем.
+    """
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )
+    _bulk_insert([
+        TimelineEntry(
+            user_id=user_id,
+            author_id=author_id,
+            post_id=post_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    ])
+
+
+def fan_out_author(author_id):
+    """Догоняет ленты подписчиков автора, переставшего быть знаменитостью.
+
+    Каждому подписчику добавляются посты автора не старше его последней
+    записи об этом авторе; подписчику без записей — все посты. Догон идёт
+    в запросе отписки, поэтому берутся только FEED_FAN_OUT_POSTS
+    последних постов, а записи вставляются пачками по
+    FAN_OUT_BATCH_SIZE.
+    """
+    posts = list(
+        Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-pk'
+        ).values_list('pub_date', 'pk')[:settings.FEED_FAN_OUT_POSTS]
+    )
+    posts.reverse()
+    if not posts:
+        return
+    latest = dict(
+        TimelineEntry.objects.filter(author_id=author_id).values(
+            'user_id'
+        ).annotate(latest=Max('pub_date')).values_list('user_id', 'latest')
+    )
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+    entries = []
+    for user_id in followers.iterator():
+        start = 0
+        if user_id in latest:
+            start = bisect_left(posts, (latest[user_id],))
+        entries.extend(
+            TimelineEntry(
+                user_id=user_id,
+                author_id=author_id,
+                post_id=post_id,
+                pub_date=pub_date,
+            )
+            for pub_date, post_id in posts[start:]
+        )
+        if len(entries) >= FAN_OUT_BATCH_SIZE:
+            _bulk_insert(entries)
+            entries = []
+    _bulk_insert(entries)
+
+
+def unfollowed(author_id, before, after):
+    """После отписки: автор, опустившийся ниже порога, снова
+    раскладывается в ленты, и пропущенные посты догоняются.
+
+    before и after — число подписчиков до и после отписки. Сравнивается
+    переход через порог, а не точное значение: массовая отписка может
+    перескочить порог сразу на несколько подписчиков.
+    """
+    if after < celebrity_threshold() <= before:
+        fan_out_author(author_id)
+
+
+def prune_follow(user_id, author_id):
+    """Убирает из ленты читателя посты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Курсорный пагинатор, сливающий материализованную ленту читателя с
+    потоками постов знаменитостей, на которых он подписан.
+
+    Каждый поток читается по своему индексу не дальше per_page + 1 строки
+    за курсором, поэтому стоимость страницы зависит от числа знаменитостей,
+    а не от глубины страницы.
+    """
+
+    def __init__(self, user, per_page, after=None, before=None):
+        super().__init__(Post.objects.none(), per_page, after, before)
+        self.streams = [
+            (
+                TimelineEntry.objects.filter(user=user)
+                .select_related('post__author', 'post__group')
+                .order_by('-pub_date', '-post_id'),
+                'post_id',
+            )
+        ]
+        self.streams.extend(
+            (
+                Post.objects.feed().filter(author_id=author_id)
+                .order_by('-pub_date', '-pk'),
+                'pk',
+            )
+            for author_id in followed_celebrities(user)
+        )
+
+    def _read_stream(self, queryset, tiebreak, cursor, forward):
+        rows = seek(
+            queryset, cursor, forward, self.per_page + 1,
+            tiebreak=tiebreak,
+        )
+        if queryset.model is TimelineEntry:
+            return [entry.post for entry in rows]
+        return rows
+
+    def _seek(self, cursor, forward):
+        merged = heapq.merge(
+            *(
+                self._read_stream(queryset, tiebreak, cursor, forward)
+                for queryset, tiebreak in self.streams
+            ),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=forward,
+        )
+        seen = set()
+        unique = (
+            seen.add(post.pk) or post
+            for post in merged
+            if post.pk not in seen
+        )
+        return list(islice(unique, self.per_page + 1))
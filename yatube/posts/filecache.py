@@ -0,0 +1,59 @@
+"""Файловый кэш, общий для всех процессов сервера.
+
+Встроенный FileBasedCache пишет значения атомарно (переименованием
+временного файла), но add и incr в нём — проверка и запись двумя
+шагами: два процесса могут оба «взять» одну блокировку или потерять
+прибавку счётчика. Здесь add создаёт файл жёсткой ссылкой, которая не
+перезаписывает существующий, а incr идёт под блокировкой каталога кэша.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.core.cache.backends import filebased
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.files import locks
+
+LOCK_NAME = '.lock'
+
+
+class FileBasedCache(filebased.FileBasedCache):
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        fname = self._key_to_file(key, version)
+        if self._alive(fname):
+            return False
+        self._createdir()
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+    def _alive(self, fname):
+        """Лежит ли в fname непросроченное значение; просроченный файл
+        заодно удаляется."""
+        try:
+            with open(fname, 'rb') as f:
+                return not self._is_expired(f)
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def _exclusive(self):
+        self._createdir()
+        with open(os.path.join(self._dir, LOCK_NAME), 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def incr(self, key, delta=1, version=None):
+        with self._exclusive():
+            return super().incr(key, delta, version)
@@ -1,6 +1,10 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 
-from .models import Comment, Post
+from .models import Comment, Post, UploadSession
+from .uploads import limit_image
 
 
 class PostForm(forms.ModelForm):
@@ -9,9 +13,49 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, data=None, files=None, *args, **kwargs):
+        # Обрезанную по лимиту загрузку ImageField счёл бы битой
+        # картинкой; убираем её из файлов и сообщаем о размере сами.
+        self.truncated_image = None
+        if files and getattr(files.get('image'), 'truncated', False):
+            self.truncated_image = files['image']
+            files = files.copy()
+            del files['image']
+        super().__init__(data, files, *args, **kwargs)
+
+    def clean_image(self):
+        image = self.truncated_image
+        if image is None:
+            image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image = limit_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
 
     class Meta:
         model = Comment
         fields = ('text', )
+
+
+class UploadSessionForm(forms.ModelForm):
+
+    class Meta:
+        model = UploadSession
+        fields = ('filename', 'size')
+
+    def clean_size(self):
+        # Размер объявляется заранее, чтобы не принимать лишние части.
+        size = self.cleaned_data['size']
+        if size > settings.POST_IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                'Файл больше %(limit)s.',
+                code='too_large',
+                params={
+                    'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)
+                },
+            )
+        if not size:
+            raise forms.ValidationError('Файл пуст.', code='empty')
+        return size
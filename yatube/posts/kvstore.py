@@ -0,0 +1,160 @@
+"""KV-хранилище миниатюр sorl: общая таблица плюс LRU в процессе.
+
+Метаданные миниатюр живут в таблице sorl (KVStore) общей базы, поэтому
+их видят все воркеры и они переживают перезапуск. Перед таблицей стоит
+ограниченный LRU процесса; записи в нём живут THUMBNAIL_LRU_TIMEOUT
+секунд, чтобы удаление в другом воркере не держалось в памяти вечно.
+Отсутствующие ключи в LRU не кладутся: миниатюру, построенную другим
+воркером, следующий запрос найдёт в таблице.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+# SQLite не принимает больше 999 параметров в одном запросе.
+BATCH_SIZE = 500
+
+
+class LRU:
+    """Потокобезопасный словарь на size записей с вытеснением старых."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class KVStore(KVStoreBase):
+    def __init__(self):
+        super().__init__()
+        self.lru = LRU(
+            settings.THUMBNAIL_LRU_SIZE, settings.THUMBNAIL_LRU_TIMEOUT
+        )
+        self._warm = False
+        self._warm_lock = threading.Lock()
+
+    def warm_up(self):
+        """При первом обращении процесса подгружает в LRU миниатюры
+        свежих постов, которые покажут первые страницы лент."""
+        if self._warm:
+            return
+        with self._warm_lock:
+            if self._warm:
+                return
+            self._warm = True
+        if settings.THUMBNAIL_WARM_UP:
+            from . import thumbnails
+            self.get_raw_many(
+                thumbnails.latest_keys(settings.THUMBNAIL_WARM_UP)
+            )
+
+    def clear(self, delete_thumbnails=False):
+        prefix = sorl_settings.THUMBNAIL_KEY_PREFIX
+        if delete_thumbnails:
+            self.delete_all_thumbnail_files()
+        KVStoreModel.objects.filter(key__startswith=prefix).delete()
+        self.lru.clear()
+
+    def _get_raw(self, key):
+        self.warm_up()
+        value = self.lru.get(key)
+        if value is None:
+            value = KVStoreModel.objects.filter(key=key).values_list(
+                'value', flat=True
+            ).first()
+            if value is not None:
+                self.lru.set(key, value)
+        return value
+
+    def get_raw_many(self, keys):
+        """Значения по ключам и число найденных в LRU; остальные ключи
+        добираются из таблицы запросами по BATCH_SIZE штук."""
+        self.warm_up()
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.lru.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        hits = len(values)
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start:start + BATCH_SIZE]
+            rows = KVStoreModel.objects.filter(key__in=batch).values_list(
+                'key', 'value'
+            )
+            for key, value in rows:
+                self.lru.set(key, value)
+                values[key] = value
+        return values, hits
+
+    def _set_raw(self, key, value):
+        KVStoreModel.objects.update_or_create(
+            key=key, defaults={'value': value}
+        )
+        self.lru.set(key, value)
+
+    def _delete_raw(self, *keys):
+        KVStoreModel.objects.filter(key__in=keys).delete()
+        self.lru.delete(*keys)
+
+    def find_key_batches(self, prefix, size=BATCH_SIZE):
+        """Ключи с префиксом пачками по size, по порядку ключа: пачки
+        читаются по индексу и не ломаются удалением уже пройденных."""
+        keys = KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).order_by('key').values_list('key', flat=True)
+        batch = list(keys[:size])
+        while batch:
+            yield batch
+            batch = list(keys.filter(key__gt=batch[-1])[:size])
+
+    def get_thumbnails(self, image_file):
+        """Миниатюры исходника одним пакетным чтением, а не по одной."""
+        keys = self._get(image_file.key, identity='thumbnails') or []
+        values, _ = self.get_raw_many([add_prefix(key) for key in keys])
+        return [deserialize_image_file(value) for value in values.values()]
+
+    def _find_keys_raw(self, prefix):
+        return KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).values_list('key', flat=True)
@@ -0,0 +1,55 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры шаблонов и превью для картинок уже '
+            'существующих постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Сколько картинок ставить в пул до ожидания результатов.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).order_by('pk')
+        total = 0
+        pending = []
+        for name in names.iterator():
+            future = thumbnails.submit(name)
+            if future is not None:
+                pending.append(future)
+            total += 1
+            if len(pending) >= chunk_size:
+                wait(pending)
+                pending = []
+        wait(pending)
+        self.stdout.write(f'Обработано картинок: {total}.')
+        self.stdout.write(f'Заполнено превью: {self.fill_placeholders()}.')
+
+    def fill_placeholders(self):
+        posts = Post.objects.exclude(image='').filter(
+            image_placeholder=''
+        ).only('pk', 'image')
+        filled = 0
+        for post in posts.iterator():
+            width, height, placeholder = thumbnails.placeholder(post.image)
+            if placeholder:
+                # update() не будит сигналы сохранения поста.
+                Post.objects.filter(pk=post.pk).update(
+                    image_width=width,
+                    image_height=height,
+                    image_placeholder=placeholder,
+                )
+                filled += 1
+        return filled
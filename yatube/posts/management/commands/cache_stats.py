@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import cache_counters
+from posts.thumbnails import thumbnail_counters
+
+
+class Command(BaseCommand):
+    help = ('Показывает счётчики попаданий, промахов и устаревших ответов '
+            'кэша страниц и счётчики поиска миниатюр, накопленные всеми '
+            'процессами, которые пишут в тот же кэш (CACHES["default"]).')
+
+    def handle(self, *args, **options):
+        self.report('Страницы', cache_counters())
+        self.report('Миниатюры', thumbnail_counters())
+
+    def report(self, title, counters):
+        self.stdout.write(f'{title}:')
+        total = sum(counters.values()) or 1
+        for event, count in counters.items():
+            self.stdout.write(
+                f'{event:6} {count:8} ({count / total:.1%})'
+            )
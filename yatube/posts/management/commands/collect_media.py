@@ -0,0 +1,208 @@
+import os
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from posts import thumbnails
+from posts.models import Post, UploadSession
+from posts.uploads import finish_session, session_path
+
+
+def session_id(name):
+    """Номер сессии загрузки по имени её файла или None."""
+    try:
+        return uuid.UUID(os.path.splitext(os.path.basename(name))[0])
+    except ValueError:
+        return None
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы картинок, миниатюр и загрузок, на которые '
+            'больше ничего не ссылается.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов проверять и удалять за один проход.',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.1,
+            help='Пауза в секундах после каждой пачки удалений.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.MEDIA_GRACE_PERIOD,
+            help='Не трогать файлы, изменённые меньше стольких секунд назад.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, сколько места можно освободить.',
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['min_age']
+        # Записи KV-хранилища, которые снимает проход по удалённым
+        # картинкам, и уже посчитанные им файлы миниатюр. В пробном
+        # прогоне записи остаются на месте, и проход по файлам миниатюр
+        # берёт их отсюда.
+        self.dropped = set()
+        self.counted = set()
+        storage = thumbnails.image_storage()
+        upload_to = Post._meta.get_field('image').upload_to
+        # Сначала снимаются записи, после которых файлы становятся
+        # ничьими: миниатюры удалённых картинок и просроченные сессии.
+        report = [
+            ('Просроченные загрузки', self.expired_sessions()),
+            ('Миниатюры удалённых картинок', self.orphan_sources()),
+            ('Брошенные загрузки', self.collect_files(
+                storage, settings.UPLOAD_SESSIONS_DIR, self.unknown_sessions
+            )),
+            ('Оригиналы', self.collect_files(
+                storage, upload_to, self.unreferenced_images
+            )),
+            ('Миниатюры', self.collect_files(
+                default.storage,
+                sorl_settings.THUMBNAIL_PREFIX,
+                self.unknown_thumbnails,
+            )),
+        ]
+        for title, (count, size) in report:
+            self.stdout.write(
+                f'{title}: файлов {count}, {filesizeformat(size)}.'
+            )
+        verb = 'Можно освободить' if self.dry_run else 'Освобождено'
+        total = sum(size for _, (_, size) in report)
+        self.stdout.write(f'{verb}: {filesizeformat(total)}.')
+
+    def throttle(self, deleted):
+        if deleted and not self.dry_run:
+            time.sleep(self.pause)
+
+    def scan(self, storage, directory):
+        """Файлы каталога хранилища старше --min-age: пары (имя, размер).
+
+        Дерево обходится os.scandir по одному каталогу, так что в памяти
+        не бывает списка всех файлов.
+        """
+        root = storage.path('')
+        pending = [storage.path(directory)]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_mtime < self.deadline:
+                        name = os.path.relpath(entry.path, root)
+                        yield name.replace(os.sep, '/'), stat.st_size
+
+    def collect_files(self, storage, directory, unreferenced):
+        """Удаляет файлы каталога, которые unreferenced признала ничьими.
+
+        Перед удалением дата изменения проверяется ещё раз: файл, который
+        только что снова понадобился, хранилище успело тронуть.
+        """
+        count = size = 0
+        for batch in batches(self.scan(storage, directory), self.batch_size):
+            sizes = dict(batch)
+            orphans = unreferenced(list(sizes))
+            for name in orphans:
+                if not self.dry_run:
+                    try:
+                        if os.stat(storage.path(name)).st_mtime >= (
+                                self.deadline):
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    storage.delete(name)
+                count += 1
+                size += sizes[name]
+            self.throttle(orphans)
+        return count, size
+
+    def unknown_thumbnails(self, names):
+        return thumbnails.unknown_thumbnails(
+            [name for name in names if name not in self.counted],
+            self.dropped,
+        )
+
+    def unreferenced_images(self, names):
+        referenced = set(Post.objects.filter(image__in=names).values_list(
+            'image', flat=True
+        ))
+        return [name for name in names if name not in referenced]
+
+    def unknown_sessions(self, names):
+        ids = {name: session_id(name) for name in names}
+        known = set(UploadSession.objects.filter(
+            pk__in=[pk for pk in ids.values() if pk is not None]
+        ).values_list('pk', flat=True))
+        return [name for name, pk in ids.items() if pk not in known]
+
+    def expired_sessions(self):
+        count = size = 0
+        sessions = UploadSession.objects.expired().order_by('pk')
+        batch = list(sessions[:self.batch_size])
+        while batch:
+            # delete() обнуляет pk, поэтому курсор берём заранее.
+            last_pk = batch[-1].pk
+            for session in batch:
+                try:
+                    size += os.path.getsize(session_path(session))
+                    count += 1
+                except FileNotFoundError:
+                    pass
+                if not self.dry_run:
+                    finish_session(session)
+            self.throttle(batch)
+            batch = list(sessions.filter(pk__gt=last_pk)[:self.batch_size])
+        return count, size
+
+    def orphan_sources(self):
+        count = size = 0
+        for sources in thumbnails.orphan_sources(self.batch_size):
+            for source in sources:
+                for thumbnail in default.kvstore.get_thumbnails(source):
+                    self.dropped.add(add_prefix(thumbnail.key))
+                    try:
+                        size += thumbnail.storage.size(thumbnail.name)
+                        count += 1
+                        self.counted.add(thumbnail.name)
+                    except OSError:
+                        pass
+                if not self.dry_run:
+                    default.kvstore.delete(source)
+            self.throttle(sources)
+        return count, size
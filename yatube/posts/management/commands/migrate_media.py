@@ -0,0 +1,105 @@
+from concurrent.futures import wait
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from sorl.thumbnail import default
+
+from posts import caching, thumbnails
+from posts.models import Post
+from posts.storage import is_addressed
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище с именами по содержимому '
+            'и переписывает Post.image пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов обрабатывать за один проход.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать файлы для переноса, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        storage = thumbnails.image_storage()
+        dry_run = options['dry_run']
+        last_pk = 0
+        moved = updated = missing = 0
+        while True:
+            rows = list(
+                Post.objects.filter(pk__gt=last_pk).exclude(
+                    image=''
+                ).order_by('pk').values_list('pk', 'image')[
+                    :options['batch_size']
+                ]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            renames, absent = self.copy(
+                storage, [name for _, name in rows], dry_run
+            )
+            missing += absent
+            moved += len(renames)
+            if dry_run or not renames:
+                continue
+            updated += self.rewrite(renames)
+            pending = []
+            for old, new in renames.items():
+                default.kvstore.delete(thumbnails.source_file(old))
+                storage.delete(old)
+                pending.append(thumbnails.submit(new))
+            wait([future for future in pending if future is not None])
+        verb = 'Нужно перенести' if dry_run else 'Перенесено'
+        self.stdout.write(
+            f'{verb} файлов: {moved}, обновлено постов: {updated}, '
+            f'не найдено файлов: {missing}.'
+        )
+
+    def copy(self, storage, names, dry_run):
+        """Копирует картинки names под имена по содержимому; возвращает
+        словарь старое имя -> новое (в dry_run новые имена None) и число
+        ненайденных файлов. Старые файлы остаются на месте."""
+        renames = {}
+        missing = 0
+        for name in names:
+            if is_addressed(name) or name in renames:
+                continue
+            try:
+                exists = storage.exists(name)
+            except SuspiciousFileOperation:
+                exists = False
+            if not exists:
+                missing += 1
+            elif dry_run:
+                renames[name] = None
+            else:
+                with storage.open(name) as content:
+                    renames[name] = storage.save(name, content)
+        return renames, missing
+
+    def rewrite(self, renames):
+        """Одним UPDATE переводит все посты, включая посты из следующих
+        пачек, со старых имён на новые, чтобы старые файлы можно было
+        удалить сразу. update() не будит сигналы, поэтому закэшированные
+        страницы этих постов сбрасываются здесь."""
+        posts = Post.objects.filter(image__in=list(renames))
+        with transaction.atomic():
+            pks = list(posts.values_list('pk', flat=True))
+            updated = posts.update(
+                image=Case(
+                    *[When(image=old, then=Value(new))
+                      for old, new in renames.items()],
+                    default=F('image'),
+                )
+            )
+        caching.bump(*[f'post:{pk}' for pk in pks])
+        return updated
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import querybudget, queryplans
+
+
+class Command(BaseCommand):
+    help = (
+        'Снимает EXPLAIN QUERY PLAN горячих страниц на временной базе и '
+        'сравнивает с query_plans.json.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Перезаписать query_plans.json текущими планами.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Снимки планов снимаются только на SQLite.')
+        with querybudget.throwaway_database():
+            current = queryplans.capture()
+        if options['update']:
+            queryplans.save_snapshot(current)
+            self.stdout.write('Планы записаны в query_plans.json.')
+            return
+        snapshot = queryplans.load_snapshot()
+        for name in queryplans.changes(current, snapshot):
+            self.stdout.write(f'{name}: план изменился')
+            for sql, lines in current[name].items():
+                self.stdout.write(f'  {sql}')
+                for line in lines:
+                    self.stdout.write(f'    {line}')
+        problems = queryplans.regressions(current, snapshot)
+        if problems:
+            raise CommandError('Регрессии планов:\n' + '\n'.join(problems))
+        self.stdout.write('Регрессий планов нет.')
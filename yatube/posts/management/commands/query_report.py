@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import querybudget
+
+
+class Command(BaseCommand):
+    help = (
+        'Засевает временную базу, замеряет запросы и время ответа для '
+        'каждого именованного URL и сравнивает с query_budgets.json.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Перезаписать query_budgets.json текущими замерами.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Сколько раз запрашивать страницу для замера времени.',
+        )
+        parser.add_argument(
+            '--skip-time',
+            action='store_true',
+            help='Сравнивать с бюджетом только число запросов.',
+        )
+
+    def handle(self, *args, **options):
+        with querybudget.throwaway_database():
+            report = querybudget.collect(repeat=options['repeat'])
+
+        budgets = {}
+        if not options['update']:
+            budgets = querybudget.load_budgets()
+        for name, roles in sorted(report.items()):
+            for role, numbers in roles.items():
+                budget = budgets.get(name, {}).get(role, {})
+                self.stdout.write(
+                    f'{name:32} {role:10} '
+                    f'{numbers["queries"]:4} запросов '
+                    f'(бюджет {budget.get("queries", "-")}) '
+                    f'{numbers["ms"]:8.1f} мс '
+                    f'(бюджет {budget.get("ms", "-")})'
+                )
+        if options['update']:
+            querybudget.save_budgets(report)
+            self.stdout.write('Бюджеты записаны в query_budgets.json.')
+            return
+        problems = querybudget.violations(
+            report, budgets, check_time=not options['skip_time']
+        )
+        if problems:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(problems))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики UserStats/GroupStats и комментариев '
+            'постов и чинит расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений, ничего не меняя.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько авторов, групп или постов пересчитывать '
+                 'за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        fix = not options['dry_run']
+        chunk_size = options['chunk_size']
+        users = stats.recount_users(fix=fix, chunk_size=chunk_size)
+        groups = stats.recount_groups(fix=fix, chunk_size=chunk_size)
+        posts = stats.recount_posts(fix=fix, chunk_size=chunk_size)
+        verb = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(
+            f'{verb} расхождений: авторов {users}, групп {groups}, '
+            f'постов {posts}.'
+        )
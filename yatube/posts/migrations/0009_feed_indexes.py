@@ -0,0 +1,83 @@
+# Generated by Django 2.2.16 on 2026-10-18 10:39
+"""Индексы под запросы лент и уникальность подписки.
+
+EXPLAIN QUERY PLAN на SQLite 3.40 до и после миграции:
+
+    index    SCAN posts_post USING INDEX posts_post_author_id_...
+             + USE TEMP B-TREE FOR ORDER BY
+          -> SCAN posts_post USING INDEX post_pub_date_idx
+    group    SEARCH posts_post USING INDEX posts_post_group_id_... (group_id=?)
+             + USE TEMP B-TREE FOR ORDER BY
+          -> SEARCH posts_post USING INDEX post_group_pub_date_idx (group_id=?)
+    profile  SEARCH posts_post USING INDEX posts_post_author_id_... (author_id=?)
+             + USE TEMP B-TREE FOR ORDER BY
+          -> SEARCH posts_post USING INDEX post_author_pub_date_idx (author_id=?)
+    comments SEARCH posts_comment USING INDEX posts_comment_post_id_...
+             + USE TEMP B-TREE FOR ORDER BY
+          -> SEARCH posts_comment USING INDEX comment_post_created_idx
+    follow   SEARCH posts_follow USING INDEX posts_follow_user_id_... (user_id=?)
+          -> SEARCH posts_follow USING COVERING INDEX
+             sqlite_autoindex_posts_follow_1 (user_id=? AND author_id=?)
+
+pub_date в индексах по возрастанию: SQLite читает их в обратную сторону и
+получает ORDER BY pub_date DESC, id DESC целиком, потому что rowid хранится
+в конце каждой записи индекса. С pub_date DESC остаётся досортировка по id
+(USE TEMP B-TREE FOR RIGHT PART OF ORDER BY).
+"""
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def dedupe_follows(apps, schema_editor):
+    """Оставляет самую раннюю из повторяющихся подписок (user, author) и
+    уменьшает денормализованные счётчики на число удалённых дублей."""
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = (
+        Follow.objects.order_by()
+        .values('user_id', 'author_id')
+        .annotate(first_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates.iterator():
+        removed, _ = Follow.objects.filter(
+            user_id=row['user_id'], author_id=row['author_id']
+        ).exclude(id=row['first_id']).delete()
+        UserStats.objects.filter(user_id=row['author_id']).update(
+            followers_count=F('followers_count') - removed
+        )
+        UserStats.objects.filter(user_id=row['user_id']).update(
+            following_count=F('following_count') - removed
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['pub_date'], name='post_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'pub_date'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'pub_date'], name='post_group_pub_date_idx'),
+        ),
+        migrations.RunPython(dedupe_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -1,5 +1,12 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -16,7 +23,26 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class AtomicSaveMixin:
+    """save() вместе с обработчиками post_save в одной транзакции.
+
+    Сигналы сдвигают денормализованные счётчики (posts.stats) через F();
+    без общей транзакции запись могла сохраниться, а сдвиг — нет.
+    Удаление и так идёт одной транзакцией с post_delete (Collector).
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты вместе с авторами и группами одним запросом."""
+        return self.select_related('author', 'group')
+
+
+class Post(AtomicSaveMixin, models.Model):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -43,19 +69,74 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Заполняются при сохранении новой картинки, см. posts.thumbnails.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_placeholder = models.TextField(
+        'Превью картинки',
+        blank=True,
+        editable=False,
+        help_text='Крошечное превью в data URI, пока грузится картинка'
+    )
+    # Поддерживается сигналами Comment, см. posts.stats.
+    comments_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    # Поля, которые пишет правка поста (update_fields). comments_count
+    # сдвигают только сигналы комментариев через F(), поэтому сохранение
+    # прочитанного раньше поста не должно его затирать.
+    EDIT_FIELDS = (
+        'text', 'author', 'group',
+        'image', 'image_width', 'image_height', 'image_placeholder',
+    )
 
     class Meta:
         ordering = ('-pub_date', )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=('pub_date',), name='post_pub_date_idx'),
+            models.Index(
+                fields=('author', 'pub_date'),
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('group', 'pub_date'),
+                name='post_group_pub_date_idx'
+            ),
+            # Число постов с картинкой — счётчик ссылок на её файл.
+            models.Index(fields=('image',), name='post_image_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(models.Model):
+class CommentQuerySet(models.QuerySet):
+    def with_authors(self):
+        """Комментарии вместе с авторами одним запросом."""
+        return self.select_related('author')
+
+
+class Comment(AtomicSaveMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -71,11 +152,19 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=('post', 'created'),
+                name='comment_post_created_idx'
+            ),
+        ]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -89,3 +178,124 @@ class Follow(models.Model):
 
     class Meta:
         verbose_name_plural = 'Подписка'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост).
+
+    Заполняется при публикации поста и при подписке, поэтому страница
+    «Избранные авторы» читается одним диапазоном индекса по user.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики автора, которые поддерживаются сигналами Post и Follow."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Статистика авторов'
+
+
+class GroupStats(models.Model):
+    """Счётчики группы, которые поддерживаются сигналами Post."""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Статистика групп'
+
+
+class UploadSessionQuerySet(models.QuerySet):
+    def active(self):
+        """Сессии моложе UPLOAD_SESSION_TTL."""
+        return self.filter(created__gte=self._deadline())
+
+    def expired(self):
+        return self.filter(created__lt=self._deadline())
+
+    def _deadline(self):
+        return timezone.now() - timedelta(
+            seconds=settings.UPLOAD_SESSION_TTL
+        )
+
+
+class UploadSession(models.Model):
+    """Докачиваемая загрузка картинки по частям, см. posts.uploads.
+
+    offset — сколько байт уже лежит в файле сессии на диске; следующая
+    часть принимается только с этого смещения.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveIntegerField('Размер в байтах')
+    offset = models.PositiveIntegerField('Принято байт', default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = UploadSessionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'Сессии загрузки'
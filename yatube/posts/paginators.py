@@ -0,0 +1,187 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает токен курсора; на мусор возвращает None."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit('|', 1)
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def past(cursor, key_field='pub_date', tiebreak='pk', descending=True):
+    """Условие «строка идёт после курсора» при обходе по убыванию
+    (descending=True) или возрастанию (key_field, tiebreak)."""
+    value, pk = cursor
+    lookup = 'lt' if descending else 'gt'
+    return (
+        Q(**{f'{key_field}__{lookup}': value})
+        | Q(**{key_field: value, f'{tiebreak}__{lookup}': pk})
+    )
+
+
+def seek(queryset, cursor, forward, limit, key_field='pub_date',
+         tiebreak='pk', descending=True):
+    """Возвращает до limit строк за курсором в направлении обхода.
+
+    queryset должен быть уже упорядочен по (key_field, tiebreak) в порядке
+    показа; forward=False идёт к началу ленты и отдаёт строки в обратном
+    порядке.
+    """
+    if cursor is not None:
+        queryset = queryset.filter(
+            past(cursor, key_field, tiebreak, forward == descending)
+        )
+    if not forward:
+        queryset = queryset.reverse()
+    return list(queryset[:limit])
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (поле даты, id) без COUNT(*) и OFFSET.
+
+    Страница выбирается условием `(key, id) < курсор` по индексу, поэтому
+    любая по глубине страница стоит столько же, сколько первая. Номера
+    страниц относительны текущему окну: у страницы с предыдущей number
+    равен 2, num_pages равен number + 1, если есть следующая.
+    Второй ключ задаёт `tiebreak` (по умолчанию pk), например post_id для
+    строк материализованной ленты.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, after=None, before=None,
+                 key='-pub_date', tiebreak='pk'):
+        self.key_field = key.lstrip('-')
+        self.descending = key.startswith('-')
+        self.tiebreak = tiebreak
+        direction = '-' if self.descending else ''
+        object_list = object_list.order_by(
+            f'{direction}{self.key_field}', f'{direction}{tiebreak}'
+        )
+        super().__init__(object_list, per_page)
+        self.after = decode_cursor(after)
+        self.before = None if self.after else decode_cursor(before)
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._window = (False, False)
+
+    def _seek(self, cursor, forward):
+        return seek(
+            self.object_list, cursor, forward, self.per_page + 1,
+            key_field=self.key_field, tiebreak=self.tiebreak,
+            descending=self.descending,
+        )
+
+    def _cursor_for(self, obj):
+        return encode_cursor(
+            getattr(obj, self.key_field), getattr(obj, self.tiebreak)
+        )
+
+    def get_page(self, number=None):
+        has_previous = has_next = False
+        rows = []
+        if self.after:
+            rows = self._seek(self.after, forward=True)
+            has_previous = True
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        elif self.before:
+            rows = self._seek(self.before, forward=False)
+            has_previous = len(rows) > self.per_page
+            has_next = True
+            rows = rows[:self.per_page][::-1]
+        if not rows:
+            rows = self._seek(None, forward=True)
+            has_previous = False
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        if has_next and rows:
+            self.next_cursor = self._cursor_for(rows[-1])
+        if has_previous and rows:
+            self.previous_cursor = self._cursor_for(rows[0])
+        self._window = (has_previous, has_next)
+        return self._get_page(rows, 2 if has_previous else 1, self)
+
+    @cached_property
+    def num_pages(self):
+        has_previous, has_next = self._window
+        return 1 + has_previous + has_next
+
+    def page(self, number):
+        return self.get_page()
+
+
+def estimated_count(queryset):
+    """Примерное число строк таблицы queryset по статистике планировщика.
+
+    PostgreSQL хранит его в pg_class.reltuples, SQLite — первым числом
+    sqlite_stat1 после ANALYZE. Если статистики нет, возвращает None.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 появляется только после первого ANALYZE.
+        return None
+    if row is None:
+        return None
+    return _parse_estimate(row[0])
+
+
+def _parse_estimate(value):
+    if isinstance(value, str):
+        # sqlite_stat1: «строк_в_таблице строк_на_ключ ...».
+        value = value.split()[0]
+    # reltuples — float, до первого ANALYZE в PostgreSQL 14+ равен -1.
+    estimate = int(float(value))
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для больших таблиц без точного COUNT(*).
+
+    Без фильтров число строк берётся из статистики базы, с фильтрами —
+    считается не дальше ESTIMATED_COUNT_LIMIT строк: глубже по такой
+    выборке ходят по курсору, а не по номерам страниц.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None:
+                return estimate
+        limit = settings.ESTIMATED_COUNT_LIMIT
+        return queryset.order_by()[:limit].count()
@@ -0,0 +1,219 @@
+"""Замер числа SQL-запросов и времени ответа для всех именованных URL.
+
+Бюджеты лежат в query_budgets.json рядом с модулем; тест
+test_query_budget падает, если страница их превысила, а команда
+query_report печатает текущие значения и умеет обновить файл.
+
+Бюджет времени записывается с большим запасом, чтобы ловить заметные
+замедления, а не шум. На медленной или перегруженной машине проверку
+времени отключает переменная окружения QUERY_BUDGET_TIME=0 (у команды —
+ключ --skip-time); число запросов проверяется всегда.
+"""
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from .models import Comment, Follow, Group, Post, UploadSession, User
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+URLCONFS = (
+    ('posts', 'posts.urls'),
+    ('auth', 'users.urls'),
+    ('about', 'about.urls'),
+)
+ROLES = ('anonymous', 'user')
+AUTHORS = 8
+POSTS_PER_AUTHOR = 15
+COMMENTS = 30
+# При записи бюджета время берётся с запасом: замеры на разных машинах
+# плавают сильнее, чем число запросов.
+TIME_HEADROOM = 5
+MIN_TIME_BUDGET_MS = 100
+TIME_CHECK_ENV = 'QUERY_BUDGET_TIME'
+
+
+@contextmanager
+def throwaway_database():
+    """Временная тестовая база для команд, которые засевают данные.
+
+    DEBUG выключается, как в тестах: страницы ошибок тогда рендерятся
+    шаблонами проекта и замеры совпадают с бюджетами.
+    """
+    setup_test_environment(debug=False)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed():
+    """Создаёт набор данных, похожий на боевой, и возвращает значения
+    параметров URL и пользователя для залогиненных замеров."""
+    reader = User.objects.create_user(
+        username='budget-reader', first_name='Читатель'
+    )
+    groups = [
+        Group.objects.create(
+            title=f'Группа {number}',
+            slug=f'budget-group-{number}',
+            description='Описание группы',
+        )
+        for number in range(3)
+    ]
+    authors = []
+    for number in range(AUTHORS):
+        author = User.objects.create_user(
+            username=f'budget-author-{number}',
+            first_name='Автор',
+            last_name=str(number),
+        )
+        authors.append(author)
+        if number % 2 == 0:
+            Follow.objects.create(user=reader, author=author)
+        for index in range(POSTS_PER_AUTHOR):
+            Post.objects.create(
+                author=author,
+                group=groups[index % len(groups)] if index % 3 else None,
+                text=f'Пост {index} автора {number}',
+            )
+    post = Post.objects.create(
+        author=reader, group=groups[0], text='Пост с обсуждением'
+    )
+    for index in range(COMMENTS):
+        Comment.objects.create(
+            post=post,
+            author=authors[index % len(authors)],
+            text=f'Комментарий {index}',
+        )
+    session = UploadSession.objects.create(
+        user=reader, filename='budget.gif', size=1024
+    )
+    # Картинку без файла на диске отдаёт самый дорогой путь вариантов:
+    # промах KV-хранилища и проверка, что на картинку ссылается пост.
+    return reader, {
+        'slug': groups[0].slug,
+        'username': authors[0].username,
+        'post_id': post.pk,
+        'width': settings.POST_IMAGE_WIDTHS[0],
+        'name': 'posts/budget.gif',
+        'session_id': session.pk,
+    }
+
+
+def routes(kwargs):
+    """Пары (имя маршрута, URL) для всех именованных маршрутов."""
+    for namespace, module in URLCONFS:
+        for pattern in import_module(module).urlpatterns:
+            if not pattern.name:
+                continue
+            name = f'{namespace}:{pattern.name}'
+            params = {
+                param: kwargs[param]
+                for param in pattern.pattern.converters
+            }
+            yield name, reverse(name, kwargs=params)
+
+
+def measure(url, user=None, repeat=3):
+    """Число запросов первого обращения и лучшее время из repeat."""
+    queries = None
+    best = math.inf
+    for _ in range(repeat):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            # Поток (SSE) держит место, пока ответ не закрыт.
+            client.get(url).close()
+            elapsed = (time.perf_counter() - started) * 1000
+        if queries is None:
+            queries = len(captured)
+        best = min(best, elapsed)
+    return {'queries': queries, 'ms': round(best, 1)}
+
+
+def collect(repeat=3):
+    """Засевает данные и замеряет каждый маршрут под каждой ролью."""
+    user, kwargs = seed()
+    # Прогрев KV-хранилища миниатюр случается раз на процесс и не должен
+    # попасть в замер первого маршрута.
+    default.kvstore.warm_up()
+    report = {}
+    for name, url in routes(kwargs):
+        report[name] = {
+            role: measure(
+                url, user if role == 'user' else None, repeat=repeat
+            )
+            for role in ROLES
+        }
+    return report
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path, encoding='utf-8') as budgets:
+        return json.load(budgets)
+
+
+def budgets_from(report):
+    return {
+        name: {
+            role: {
+                'queries': numbers['queries'],
+                'ms': max(
+                    MIN_TIME_BUDGET_MS,
+                    math.ceil(numbers['ms'] * TIME_HEADROOM),
+                ),
+            }
+            for role, numbers in roles.items()
+        }
+        for name, roles in sorted(report.items())
+    }
+
+
+def save_budgets(report, path=BUDGETS_PATH):
+    with open(path, 'w', encoding='utf-8') as budgets:
+        json.dump(budgets_from(report), budgets, indent=2, sort_keys=True)
+        budgets.write('\n')
+
+
+def time_check_enabled():
+    """Проверять ли время ответа: да, если не выключено окружением."""
+    return os.getenv(TIME_CHECK_ENV, '1') != '0'
+
+
+def violations(report, budgets, check_time=True):
+    """Строки с описанием каждого превышения или маршрута без бюджета;
+    без check_time сравнивается только число запросов."""
+    metrics = ('queries', 'ms') if check_time else ('queries',)
+    problems = []
+    for name, roles in sorted(report.items()):
+        for role, numbers in roles.items():
+            budget = budgets.get(name, {}).get(role)
+            if budget is None:
+                problems.append(f'{name} [{role}]: нет бюджета')
+                continue
+            for metric in metrics:
+                if numbers[metric] > budget[metric]:
+                    problems.append(
+                        f'{name} [{role}]: {metric} {numbers[metric]} '
+                        f'> {budget[metric]}'
+                    )
+    return problems
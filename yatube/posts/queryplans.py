@@ -0,0 +1,164 @@
+"""Снимки EXPLAIN QUERY PLAN для горячих страниц на SQLite.
+
+Для каждой страницы захватываются все SELECT, которые она выполняет на
+засеянной базе, и их планы; запросы узнаются по тексту SQL без значений
+параметров. Снимок хранится в query_plans.json. Регрессией считается
+таблица, которую запрос читал поиском по индексу (SEARCH), а теперь
+просматривает (SCAN), появление у запроса сортировки во временном B-дереве
+и новый запрос с полным просмотром таблицы.
+"""
+import json
+import os
+import re
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Comment, Post
+from .paginators import encode_cursor
+from .querybudget import seed
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'query_plans.json')
+# SQLite до 3.36 пишет «SCAN TABLE posts_post», новее — «SCAN posts_post».
+ACCESS = re.compile(
+    r'^(SEARCH|SCAN) (?:TABLE )?(\S+)(?: USING (\w+ )?(INDEX|INTEGER))?'
+)
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'IN \(\?(?:, \?)*\)')
+TEMP_BTREE = 'USE TEMP B-TREE'
+# Чем больше ранг, тем дешевле доступ к таблице.
+RANK_SEARCH = 2
+RANK_INDEX_SCAN = 1
+RANK_TABLE_SCAN = 0
+
+
+def pages(user, kwargs):
+    """Пары (имя, URL) для страниц, чьи запросы снимаются."""
+    oldest_on_first_page = Post.objects.order_by('-pub_date', '-pk')[9]
+    cursor = encode_cursor(
+        oldest_on_first_page.pub_date, oldest_on_first_page.pk
+    )
+    last_shown_comment = Comment.objects.filter(
+        post_id=kwargs['post_id']
+    ).order_by('created', 'pk')[9]
+    comments_cursor = encode_cursor(
+        last_shown_comment.created, last_shown_comment.pk
+    )
+    return (
+        ('index', reverse('posts:index')),
+        ('index_after', reverse('posts:index') + f'?after={cursor}'),
+        ('group_posts', reverse(
+            'posts:group_list', kwargs={'slug': kwargs['slug']}
+        )),
+        ('profile', reverse(
+            'posts:profile', kwargs={'username': kwargs['username']}
+        )),
+        ('post_detail', reverse(
+            'posts:post_detail', kwargs={'post_id': kwargs['post_id']}
+        )),
+        ('post_comments', reverse(
+            'posts:post_comments', kwargs={'post_id': kwargs['post_id']}
+        ) + f'?after={comments_cursor}'),
+        ('follow_index', reverse('posts:follow_index')),
+        ('search', reverse('posts:search') + '?q=Пост'),
+    )
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def fingerprint(sql):
+    """Текст запроса без конкретных значений параметров."""
+    return IN_LISTS.sub('IN (...)', LITERALS.sub('?', sql))
+
+
+def capture():
+    """Засевает данные и возвращает {страница: {запрос: строки плана}}."""
+    user, kwargs = seed()
+    client = Client()
+    client.force_login(user)
+    snapshot = {}
+    for name, url in pages(user, kwargs):
+        with CaptureQueriesContext(connection) as captured:
+            client.get(url)
+        snapshot[name] = {
+            fingerprint(query['sql']): explain(query['sql'])
+            for query in captured
+            if query['sql'].startswith('SELECT')
+        }
+    return snapshot
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    with open(path, encoding='utf-8') as snapshot:
+        return json.load(snapshot)
+
+
+def save_snapshot(snapshot, path=SNAPSHOT_PATH):
+    with open(path, 'w', encoding='utf-8') as out:
+        json.dump(snapshot, out, indent=2, sort_keys=True, ensure_ascii=False)
+        out.write('\n')
+
+
+def access_ranks(lines):
+    """Худший способ доступа к каждой таблице в наборе планов."""
+    ranks = {}
+    for line in lines:
+        match = ACCESS.match(line)
+        if match is None:
+            continue
+        operation, table, _, using = match.groups()
+        if operation == 'SEARCH':
+            rank = RANK_SEARCH
+        elif using is not None:
+            rank = RANK_INDEX_SCAN
+        else:
+            rank = RANK_TABLE_SCAN
+        ranks[table] = min(rank, ranks.get(table, rank))
+    return ranks
+
+
+def _plan_regressions(lines, expected):
+    problems = []
+    was = access_ranks(expected)
+    for table, rank in sorted(access_ranks(lines).items()):
+        if rank < was.get(table, RANK_INDEX_SCAN):
+            scans = [line for line in lines if f' {table}' in line]
+            problems.append(f'{table} -> {"; ".join(scans)}')
+    sorts = sum(TEMP_BTREE in line for line in lines)
+    if sorts > sum(TEMP_BTREE in line for line in expected):
+        problems.append(f'появилась сортировка {TEMP_BTREE}')
+    return problems
+
+
+def regressions(current, snapshot):
+    """Описания регрессий текущих планов относительно снимка.
+
+    Запрос, которого нет в снимке, сравнивается с пустым планом: для него
+    регрессия — только полный просмотр таблицы или сортировка.
+    """
+    problems = []
+    for name, queries in sorted(current.items()):
+        expected = snapshot.get(name)
+        if expected is None:
+            problems.append(f'{name}: нет снимка плана')
+            continue
+        for sql, lines in queries.items():
+            problems.extend(
+                f'{name}: {problem}\n    {sql}'
+                for problem in _plan_regressions(lines, expected.get(sql, []))
+            )
+    return problems
+
+
+def changes(current, snapshot):
+    """Страницы, планы которых отличаются от снимка хоть как-то."""
+    return sorted(
+        name for name, queries in current.items()
+        if snapshot.get(name) != queries
+    )
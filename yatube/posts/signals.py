@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (autocomplete, caching, events, feed, search, stats,
+               thumbnails)
+from .models import Comment, Follow, Group, Post, User
+
+# Поля пользователя, которые видны на страницах: имя автора в карточках
+# постов и в шапке, адрес профиля.
+USER_SHOWN_FIELDS = ('username', 'first_name', 'last_name')
+# Поля группы, по которым её находит автодополнение.
+GROUP_INDEXED_FIELDS = ('title', 'slug')
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # Запоминаем прежние группу и картинку: счётчик группы переносится,
+    # а миниатюры строятся заново только для новой картинки.
+    instance._saved_group_id = None
+    instance._saved_image = None
+    if instance.pk is not None and not raw:
+        instance._saved_group_id, instance._saved_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image'
+            ).first() or (None, None)
+        )
+    if not raw and instance.image.name != instance._saved_image:
+        if instance.image:
+            (instance.image_width, instance.image_height,
+             instance.image_placeholder) = thumbnails.placeholder(
+                instance.image
+            )
+        else:
+            instance.image_width = instance.image_height = None
+            instance.image_placeholder = ''
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    # Посты из фикстур тоже должны находиться поиском.
+    if update_fields is None or 'text' in update_fields:
+        search.index_post(instance)
+    if raw:
+        return
+    tags = caching.post_tags(instance) | {'posts'}
+    if created:
+        stats.shift_post(instance.author_id, instance.group_id, 1)
+        autocomplete.shift_post(instance.author_id, instance.group_id, 1)
+        feed.fan_out_post(instance)
+    elif instance._saved_group_id != instance.group_id:
+        stats.move_post(instance._saved_group_id, instance.group_id)
+        autocomplete.move_post(instance._saved_group_id, instance.group_id)
+        if instance._saved_group_id is not None:
+            tags.add(f'group:{instance._saved_group_id}')
+    if instance.image.name != instance._saved_image:
+        thumbnails.schedule(instance)
+        thumbnails.schedule_eviction(instance._saved_image)
+    caching.bump(*tags)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+    stats.shift_post(instance.author_id, instance.group_id, -1)
+    autocomplete.shift_post(instance.author_id, instance.group_id, -1)
+    thumbnails.schedule_eviction(instance.image.name)
+    caching.bump('posts', *caching.post_tags(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        stats.shift_comments(instance.post_id, 1)
+        post_id = instance.post_id
+        transaction.on_commit(lambda: events.bus.notify(post_id))
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.shift_comments(instance.post_id, -1)
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.shift_follow(instance.user_id, instance.author_id, 1)
+        feed.backfill_follow(instance.user_id, instance.author_id)
+        caching.bump(f'author:{instance.author_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    followers = stats.shift_follow(instance.user_id, instance.author_id, -1)
+    feed.prune_follow(instance.user_id, instance.author_id)
+    if followers is None:
+        followers = stats.user_stats(instance.author_id).followers_count
+    feed.unfollowed(instance.author_id, followers + 1, followers)
+    caching.bump(f'author:{instance.author_id}')
+
+
+def _fields_changed(instance, fields, update_fields=None):
+    """Меняет ли сохранение instance хоть одно из fields; новый объект
+    меняет все."""
+    if instance.pk is None:
+        return True
+    if update_fields is not None and not set(update_fields) & set(fields):
+        return False
+    saved = type(instance).objects.filter(pk=instance.pk).values_list(
+        *fields
+    ).first()
+    return saved != tuple(getattr(instance, field) for field in fields)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Вход, смена пароля и прав страниц не меняют: сбрасываем их и правим
+    # автодополнение, только если поменялось что-то из USER_SHOWN_FIELDS.
+    instance._shown_changed = raw or _fields_changed(
+        instance, USER_SHOWN_FIELDS, update_fields
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not getattr(instance, '_shown_changed', True):
+        return
+    # Страницы со списками постов помечены тегами авторов своих карточек,
+    # поэтому глобальный тег «posts» поднимать не нужно.
+    caching.bump(f'author:{instance.pk}')
+    autocomplete.update_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    autocomplete.remove('author', instance.pk)
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Описание группы в автодополнение не входит.
+    instance._indexed_changed = raw or _fields_changed(
+        instance, GROUP_INDEXED_FIELDS, update_fields
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, signal, raw=False, **kwargs):
+    if raw:
+        return
+    # Ленты помечены тегами групп своих карточек: хватает тега группы.
+    caching.bump(f'group:{instance.pk}')
+    if signal is post_delete:
+        autocomplete.remove('group', instance.pk)
+    elif getattr(instance, '_indexed_changed', True):
+        autocomplete.update_group(instance)
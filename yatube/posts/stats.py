@@ -0,0 +1,198 @@
+"""Денормализованные счётчики постов, подписок и комментариев.
+
+Строки UserStats/GroupStats создаются лениво при первом чтении с точным
+пересчётом, а дальше только сдвигаются на ±1 из сигналов. Сдвиг строки,
+которой ещё нет, ничего не делает: её значение посчитается при чтении.
+Число комментариев хранится прямо в Post.comments_count.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import (Comment, Follow, Group, GroupStats, Post, User,
+                     UserStats)
+
+
+def count_user(user_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def count_group(group_id):
+    return {
+        'posts_count': Post.objects.filter(group_id=group_id).count(),
+    }
+
+
+def user_stats(user_id):
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        stats, _ = UserStats.objects.get_or_create(
+            user_id=user_id, defaults=count_user(user_id)
+        )
+    return stats
+
+
+def group_stats(group_id):
+    stats = GroupStats.objects.filter(group_id=group_id).first()
+    if stats is None:
+        stats, _ = GroupStats.objects.get_or_create(
+            group_id=group_id, defaults=count_group(group_id)
+        )
+    return stats
+
+
+def _shift(queryset, delta, *fields):
+    queryset.update(**{field: F(field) + delta for field in fields})
+
+
+def shift_post(author_id, group_id, delta):
+    with transaction.atomic():
+        _shift(
+            UserStats.objects.filter(user_id=author_id), delta, 'posts_count'
+        )
+        if group_id is not None:
+            _shift(
+                GroupStats.objects.filter(group_id=group_id),
+                delta,
+                'posts_count',
+            )
+
+
+def move_post(old_group_id, new_group_id):
+    with transaction.atomic():
+        if old_group_id is not None:
+            _shift(
+                GroupStats.objects.filter(group_id=old_group_id),
+                -1,
+                'posts_count',
+            )
+        if new_group_id is not None:
+            _shift(
+                GroupStats.objects.filter(group_id=new_group_id),
+                1,
+                'posts_count',
+            )
+
+
+def shift_follow(user_id, author_id, delta):
+    """Сдвигает счётчики подписки; возвращает число подписчиков автора
+    сразу после сдвига или None, если строки автора ещё нет.
+
+    Число читается в той же транзакции, что и сдвиг: строка уже
+    заблокирована записью, и чужая отписка не вклинится между ними.
+    """
+    author_stats = UserStats.objects.filter(user_id=author_id)
+    with transaction.atomic():
+        _shift(author_stats, delta, 'followers_count')
+        _shift(
+            UserStats.objects.filter(user_id=user_id),
+            delta,
+            'following_count',
+        )
+        return author_stats.values_list(
+            'followers_count', flat=True
+        ).first()
+
+
+def shift_comments(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), delta, 'comments_count')
+
+
+def _chunks(iterator, size):
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _grouped_counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids})
+        .order_by()
+        .values(field)
+        .annotate(n=Count('pk'))
+        .values_list(field, 'n')
+    )
+
+
+def _repair(model, key, ids, expected, fix):
+    """Сверяет строки model для ids с expected; возвращает число
+    расхождений и, если fix, исправляет их."""
+    fields = {field for values in expected.values() for field in values}
+    existing = {
+        getattr(row, key): row
+        for row in model.objects.filter(**{f'{key}__in': ids}).only(
+            key, *fields
+        )
+    }
+    missing = []
+    drifted = 0
+    for pk in ids:
+        values = expected[pk]
+        row = existing.get(pk)
+        if row is None:
+            missing.append(model(**{key: pk}, **values))
+            continue
+        if any(getattr(row, field) != value
+               for field, value in values.items()):
+            drifted += 1
+            if fix:
+                model.objects.filter(**{key: pk}).update(**values)
+    if fix:
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+    return drifted
+
+
+def recount_users(fix=True, chunk_size=1000):
+    """Пересчитывает UserStats пачками пользователей; возвращает число
+    строк, разошедшихся с фактическими данными."""
+    drifted = 0
+    user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+    for ids in _chunks(user_ids.iterator(), chunk_size):
+        posts = _grouped_counts(Post.objects.all(), 'author_id', ids)
+        followers = _grouped_counts(Follow.objects.all(), 'author_id', ids)
+        following = _grouped_counts(Follow.objects.all(), 'user_id', ids)
+        expected = {
+            pk: {
+                'posts_count': posts.get(pk, 0),
+                'followers_count': followers.get(pk, 0),
+                'following_count': following.get(pk, 0),
+            }
+            for pk in ids
+        }
+        with transaction.atomic():
+            drifted += _repair(UserStats, 'user_id', ids, expected, fix)
+    return drifted
+
+
+def recount_groups(fix=True, chunk_size=1000):
+    """Пересчитывает GroupStats; возвращает число расхождений."""
+    drifted = 0
+    group_ids = Group.objects.order_by('pk').values_list('pk', flat=True)
+    for ids in _chunks(group_ids.iterator(), chunk_size):
+        posts = _grouped_counts(Post.objects.all(), 'group_id', ids)
+        expected = {pk: {'posts_count': posts.get(pk, 0)} for pk in ids}
+        with transaction.atomic():
+            drifted += _repair(GroupStats, 'group_id', ids, expected, fix)
+    return drifted
+
+
+def recount_posts(fix=True, chunk_size=1000):
+    """Пересчитывает Post.comments_count; возвращает число расхождений."""
+    drifted = 0
+    post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+    for ids in _chunks(post_ids.iterator(), chunk_size):
+        comments = _grouped_counts(Comment.objects.all(), 'post_id', ids)
+        expected = {
+            pk: {'comments_count': comments.get(pk, 0)} for pk in ids
+        }
+        with transaction.atomic():
+            drifted += _repair(Post, 'id', ids, expected, fix)
+    return drifted
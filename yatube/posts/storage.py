@@ -0,0 +1,81 @@
+"""Хранилище картинок с именами по содержимому.
+
+Файл сохраняется как `<каталог upload_to>/ab/cd/<sha256>.<расширение>`:
+два уровня подкаталогов по префиксу хеша держат каталоги маленькими, а
+одинаковые загрузки получают одно имя и лежат на диске один раз.
+Число ссылок на файл — число постов с этим именем в Post.image (поле
+проиндексировано), поэтому счётчик не расходится с базой; файл удаляет
+posts.thumbnails.evict, когда ссылок не осталось, а пропущенные им
+файлы находит команда collect_media.
+
+Повторная загрузка того же содержимого только освежает дату изменения
+файла, а пост с новой ссылкой коммитится позже. Поэтому файл, изменённый
+меньше MEDIA_GRACE_PERIOD секунд назад, evict не трогает: его удалит
+collect_media, если ссылка так и не появится.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+ADDRESSED_NAME = re.compile(
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$'
+)
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def is_addressed(name):
+    """Названо ли имя файла по содержимому."""
+    return bool(ADDRESSED_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def addressed_name(self, name, content):
+        """Имя по хешу содержимого в каталоге исходного имени."""
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return os.path.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}'
+        ).replace('\\', '/')
+
+    def recently_saved(self, name):
+        """Сохранялся ли файл меньше MEDIA_GRACE_PERIOD секунд назад."""
+        try:
+            modified = os.path.getmtime(self.path(name))
+        except OSError:
+            return False
+        return time.time() - modified < settings.MEDIA_GRACE_PERIOD
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя означает одинаковое содержимое, суффиксы не нужны.
+        return name
+
+    def _save(self, name, content):
+        name = self.addressed_name(name, content)
+        if self.exists(name):
+            # Свежая дата изменения уберегает файл от сборщика мусора,
+            # пока пост с новой ссылкой на него не закоммичен.
+            os.utime(self.path(name))
+            return name
+        # Пишем во временный файл и атомарно переименовываем: две
+        # одновременные загрузки одной картинки дают тот же файл.
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
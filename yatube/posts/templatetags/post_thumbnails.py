@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+from django.urls import reverse
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def resolve_thumbnails(posts):
+    """Проставляет post.thumbnail всем постам страницы одним обращением
+    к KV-хранилищу миниатюр."""
+    thumbnails.resolve(posts)
+    return ''
+
+
+@register.filter
+def srcset(post):
+    """Значение srcset: варианты картинки поста ширин POST_IMAGE_WIDTHS.
+
+    Варианты не увеличивают исходник, поэтому ширины больше картинки,
+    кроме самой маленькой, не перечисляются.
+    """
+    if not post.image:
+        return ''
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    if post.image_width:
+        widths = [
+            width for width in widths
+            if width <= post.image_width or width == widths[0]
+        ]
+    name = post.image.name
+    return ', '.join(
+        f"{reverse('posts:post_image', args=[width, name])} {width}w"
+        for width in widths
+    )
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Group, Post, User
+from posts.paginators import EstimatedCountPaginator, _parse_estimate
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{number}',
+                description='-'
+            )
+            for number in range(3)
+        ]
+        cls.url = reverse('admin:posts_post_changelist')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(PostAdminTest.admin)
+
+    def create_posts(self, count):
+        return [
+            Post.objects.create(
+                author=PostAdminTest.admin, text=f'Пост {number}',
+                group=PostAdminTest.groups[number % 3],
+            )
+            for number in range(count)
+        ]
+
+    def changelist_queries(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(PostAdminTest.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Авторы, группы и варианты групп грузятся не построчно"""
+        self.create_posts(2)
+        few = self.changelist_queries()
+        self.create_posts(10)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_keyset_navigation(self):
+        """«Дальше» продолжает список за последней строкой без OFFSET"""
+        posts = self.create_posts(5)
+        expected = sorted(
+            posts, key=lambda post: (post.pub_date, post.pk), reverse=True
+        )
+        seen = []
+        url = PostAdminTest.url
+        with mock.patch.object(site._registry[Post], 'list_per_page', 2):
+            while url:
+                response = self.client.get(url)
+                changelist = response.context['cl']
+                seen.extend(changelist.result_list)
+                url = changelist.next_url
+                if url:
+                    self.assertContains(response, 'Дальше')
+                    url = PostAdminTest.url + url
+        self.assertEqual(seen, expected)
+
+    def test_cursor_ignored_for_other_ordering(self):
+        """При сортировке по другой колонке курсор не применяется"""
+        self.create_posts(3)
+        response = self.client.get(
+            PostAdminTest.url, {'o': '2', 'after': 'мусор'}
+        )
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+        self.assertIsNone(response.context['cl'].next_url)
+
+    def test_comments_keyset_by_pk(self):
+        """Комментарии листаются курсором по pk"""
+        post = self.create_posts(1)[0]
+        comments = [
+            Comment.objects.create(
+                post=post, author=PostAdminTest.admin, text=f'Ответ {number}'
+            )
+            for number in range(5)
+        ]
+        seen = []
+        url = reverse('admin:posts_comment_changelist')
+        with mock.patch.object(site._registry[Comment], 'list_per_page', 2):
+            while url:
+                changelist = self.client.get(url).context['cl']
+                seen.extend(changelist.result_list)
+                url = changelist.next_url and (
+                    reverse('admin:posts_comment_changelist')
+                    + changelist.next_url
+                )
+        self.assertEqual(seen, comments[::-1])
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Пост {number}') for number in range(5)
+        )
+
+    @override_settings(ESTIMATED_COUNT_LIMIT=3)
+    def test_filtered_count_is_capped(self):
+        """С фильтром строки считаются не дальше лимита"""
+        queryset = Post.objects.filter(text__startswith='Пост')
+        self.assertEqual(EstimatedCountPaginator(queryset, 2).count, 3)
+
+    def test_unfiltered_count_from_statistics(self):
+        """Без фильтра число берётся из статистики ANALYZE"""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with self.assertNumQueries(1):
+            count = EstimatedCountPaginator(Post.objects.all(), 2).count
+        self.assertEqual(count, 5)
+
+    def test_parse_estimate(self):
+        """Статистика PostgreSQL и SQLite разбирается в целое число"""
+        self.assertEqual(_parse_estimate(12345.0), 12345)
+        self.assertEqual(_parse_estimate('5 1 1'), 5)
+        self.assertIsNone(_parse_estimate(-1.0))
@@ -0,0 +1,149 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts import autocomplete
+from posts.autocomplete import PrefixIndex, user_keys
+from posts.models import Group, Post, User
+
+
+class PrefixIndexTest(TestCase):
+    def test_prefix_ranked_by_posts(self):
+        """Совпадения по префиксу любого ключа, активные выше"""
+        index = PrefixIndex()
+        index.add(('author', 1), user_keys('leo', 'Лев', 'Толстой'),
+                  'Лев Толстой', 'leo', 3)
+        index.add(('author', 2), ('lena',), 'lena', 'lena', 10)
+        index.add(('group', 1), ('Лесники', 'forest'), 'Лесники',
+                  'forest', 5)
+        found = [target for target, _ in index.lookup('Le', 10)]
+        self.assertEqual(found, [('author', 2), ('author', 1)])
+        found = [target for target, _ in index.lookup('ЛЕ', 10)]
+        self.assertEqual(found, [('group', 1), ('author', 1)])
+        self.assertEqual(index.lookup('толст', 1)[0][0], ('author', 1))
+        self.assertEqual(index.lookup('le', 1)[0][0], ('author', 2))
+
+    def test_replace_and_remove(self):
+        """Замена ключей убирает старые, удаление — все"""
+        index = PrefixIndex()
+        index.add(('group', 1), ('cats',), 'cats', 'cats', 2)
+        index.add(('group', 1), ('dogs',), 'dogs', 'dogs')
+        self.assertFalse(index.lookup('cat', 10))
+        self.assertEqual(index.lookup('dog', 10)[0][1]['posts'], 2)
+        index.remove(('group', 1))
+        self.assertFalse(index.lookup('dog', 10))
+        self.assertEqual(len(index), 0)
+
+    def test_load_matches_incremental_adds(self):
+        """Пакетная загрузка даёт тот же индекс, что и вставки по одной"""
+        entries = [
+            (('author', pk), user_keys(f'user{pk}', name, 'Иванов'),
+             f'{name} Иванов', f'user{pk}', pk % 4)
+            for pk, name in enumerate(('Иван', 'Ира', 'Илья', 'Инна', 'Ян'))
+        ]
+        loaded = PrefixIndex()
+        loaded.load(entries)
+        added = PrefixIndex()
+        for entry in entries:
+            added.add(*entry)
+        for prefix in ('и', 'ив', 'иван', 'иванов и', 'user', 'я', 'x'):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    loaded.lookup(prefix, 3), added.lookup(prefix, 3)
+                )
+
+    def test_shift_reorders_short_prefixes(self):
+        """Сдвиг числа постов меняет порядок и для коротких префиксов"""
+        index = PrefixIndex()
+        index.load([
+            (('group', 1), ('кошки',), 'кошки', 'cats', 5),
+            (('group', 2), ('котики',), 'котики', 'kittens', 1),
+        ])
+        self.assertEqual(index.lookup('к', 1)[0][0], ('group', 1))
+        index.shift(('group', 2), 10)
+        self.assertEqual(index.lookup('к', 1)[0][0], ('group', 2))
+        self.assertEqual(index.lookup('кот', 1)[0][1]['posts'], 11)
+
+
+class AutocompleteViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.leo = User.objects.create_user(
+            username='leo', first_name='Лев', last_name='Толстой'
+        )
+        cls.lena = User.objects.create_user(username='lena')
+        cls.group = Group.objects.create(
+            title='Лесники', slug='forest', description='Лес'
+        )
+        for _ in range(2):
+            Post.objects.create(author=cls.lena, text='Пост')
+        Post.objects.create(author=cls.leo, text='Пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def suggest(self, prefix):
+        response = self.client.get(
+            reverse('posts:autocomplete'), {'q': prefix}
+        )
+        return response.json()['results']
+
+    def test_suggestions_without_queries(self):
+        """Прогретый индекс отвечает без запросов к базе"""
+        self.suggest('l')
+        with self.assertNumQueries(0):
+            results = self.suggest('l')
+        self.assertEqual(results[0], {
+            'kind': 'author',
+            'label': 'lena',
+            'url': reverse('posts:profile', args=('lena',)),
+            'posts': 2,
+        })
+        self.assertEqual(
+            [result['label'] for result in results], ['lena', 'Лев Толстой']
+        )
+
+    def test_signals_update_index(self):
+        """Сигналы правят индекс без перестройки"""
+        self.suggest('l')
+        with self.assertNumQueries(0):
+            autocomplete.update_group(AutocompleteViewTest.group)
+        Group.objects.create(title='Лирика', slug='lyrics', description='-')
+        AutocompleteViewTest.leo.first_name = 'Лёва'
+        AutocompleteViewTest.leo.save()
+        Post.objects.create(author=AutocompleteViewTest.leo, text='Ещё')
+        with self.assertNumQueries(0):
+            labels = [result['label'] for result in self.suggest('ле')]
+        self.assertEqual(labels, ['Лёва Толстой', 'Лесники'])
+        self.assertEqual(
+            [result['url'] for result in self.suggest('lyr')],
+            [reverse('posts:group_list', args=('lyrics',))],
+        )
+        AutocompleteViewTest.lena.delete()
+        self.assertFalse(self.suggest('lena'))
+
+    def test_unindexed_changes_keep_tag(self):
+        """Смена пароля и описания группы не сообщают другим процессам о
+        правке индекса"""
+        self.suggest('l')
+        version = autocomplete.caching.tag_versions([autocomplete.TAG])
+        user = User.objects.get(username='lena')
+        user.set_password('new-password')
+        user.save()
+        group = Group.objects.get(slug='forest')
+        group.description = 'Бор'
+        group.save()
+        self.assertEqual(
+            autocomplete.caching.tag_versions([autocomplete.TAG]), version
+        )
+
+    def test_other_process_edit_triggers_rebuild(self):
+        """Чужая правка (новая версия тега) перестраивает индекс"""
+        self.suggest('l')
+        User.objects.filter(pk=AutocompleteViewTest.lena.pk).update(
+            username='olena'
+        )
+        autocomplete.caching.bump(autocomplete.TAG)
+        self.assertEqual(
+            [result['label'] for result in self.suggest('ole')], ['olena']
+        )
@@ -1,6 +1,16 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from posts.caching import cache_counters, page_key
+from posts.filecache import FileBasedCache
 from posts.models import Comment, Group, Post, User
 
 
@@ -53,3 +63,143 @@ class PostURLTest(TestCase):
         cache.clear()
         response2 = self.authorized_author.get(reverse('posts:index'))
         self.assertEqual((len(response2.context['page_obj'])), post_count - 1)
+
+    def test_unchanged_pages_are_served_from_cache(self):
+        """Повторный запрос неизменной ленты не строит страницу заново"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                hits = cache_counters()['hit']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.guest_client.get(url)
+                self.assertEqual(cache_counters()['hit'], hits + 1)
+                self.assertFalse(any(
+                    'posts_post"."text"' in query['sql']
+                    for query in queries
+                ))
+                self.assertContains(response, 'Тестовый пост')
+
+    def test_new_post_invalidates_feeds_immediately(self):
+        """Новый пост сразу виден на главной, в группе и в профиле"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+            self.guest_client.get(url)
+        Post.objects.create(
+            author=self.author, group=self.group, text='Свежий пост'
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_author_rename_invalidates_cached_post_cards(self):
+        """Смена имени автора сбрасывает страницы с его постами"""
+        url = reverse('posts:group_list', kwargs={'slug': 'test-slug2'})
+        self.guest_client.get(url)
+        self.guest_client.get(url)
+        self.author.first_name = 'Переименован'
+        self.author.save()
+        self.assertContains(self.guest_client.get(url), 'Переименован')
+
+    def test_unshown_user_changes_keep_pages(self):
+        """Смена пароля, вход и новый пользователь не сбрасывают ленты"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        author = User.objects.get(pk=self.author.pk)
+        author.set_password('new-password')
+        author.save()
+        user = User.objects.get(pk=self.user.pk)
+        user.last_login = None
+        user.save(update_fields=['last_login'])
+        User.objects.create_user(username='newcomer')
+        hits = cache_counters()['hit']
+        self.guest_client.get(url)
+        self.assertEqual(cache_counters()['hit'], hits + 1)
+
+    def test_rename_refreshes_own_header(self):
+        """Переименованный пользователь видит новое имя в шапке"""
+        url = reverse('posts:group_list', kwargs={'slug': 'test-slug2'})
+        client = Client()
+        client.force_login(self.user)
+        client.get(url)
+        self.user.username = 'michael'
+        self.user.save()
+        self.assertContains(client.get(url), 'michael')
+
+    def test_pages_are_cached_per_user(self):
+        """Залогиненный пользователь не получает чужую закэшированную
+        страницу"""
+        url = reverse('posts:index')
+        for _ in range(2):
+            self.guest_client.get(url)
+        self.assertContains(self.authorized_client.get(url), 'mike')
+
+    def test_stale_page_served_while_other_worker_recomputes(self):
+        """Пока другой воркер пересчитывает страницу, отдаётся старая"""
+        url = reverse('posts:index')
+        for _ in range(2):
+            response = self.guest_client.get(url)
+        cache.add(page_key(response.wsgi_request) + ':lock', True)
+        Post.objects.create(author=self.author, text='Пока не видно')
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Пока не видно')
+        self.assertEqual(cache_counters()['stale'], 1)
+        cache.delete(page_key(response.wsgi_request) + ':lock')
+        self.assertContains(self.guest_client.get(url), 'Пока не видно')
+
+    @override_settings(TAGGED_CACHE_SOFT_TTL=-1)
+    def test_soft_ttl_expiry_recomputes_page(self):
+        """После мягкого TTL страница строится заново даже без записей"""
+        url = reverse('posts:index')
+        for _ in range(3):
+            self.guest_client.get(url)
+        self.assertEqual(
+            cache_counters(), {'hit': 0, 'miss': 3, 'stale': 0}
+        )
+
+    def test_counters_shared_between_processes(self):
+        """Счётчики видны другому процессу с тем же кэшем"""
+        url = reverse('posts:index')
+        for _ in range(2):
+            self.guest_client.get(url)
+        other_process = FileBasedCache(
+            settings.CACHES['default']['LOCATION'], {}
+        )
+        self.assertEqual(other_process.get('tagged_cache:hit'), 1)
+        self.assertEqual(other_process.get('tagged_cache:miss'), 1)
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('hit           1 (50.0%)', out.getvalue())
+
+
+class FileBasedCacheTest(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.cache = FileBasedCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_add_never_overwrites(self):
+        """add не перезаписывает живой ключ и заменяет просроченный"""
+        self.assertTrue(self.cache.add('lock', 1))
+        self.assertFalse(self.cache.add('lock', 2))
+        self.assertEqual(self.cache.get('lock'), 1)
+        self.cache.set('expired', 1, -1)
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+    def test_incr(self):
+        """incr прибавляет к сохранённому значению"""
+        self.cache.add('counter', 0, None)
+        self.cache.incr('counter')
+        self.assertEqual(self.cache.incr('counter', 2), 3)
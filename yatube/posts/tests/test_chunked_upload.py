@@ -0,0 +1,163 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import locks
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from posts.models import Post, UploadSession, User
+from posts.tests.utils import image_bytes
+from posts.uploads import session_path
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class ChunkedUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='mike')
+        cls.content = image_bytes((40, 20), color=(30, 120, 200))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(ChunkedUploadTest.user)
+
+    def start(self, size=None):
+        response = self.client.post(reverse('posts:upload_start'), {
+            'filename': 'photo.png',
+            'size': size or len(self.content),
+        })
+        return response
+
+    def send(self, session_id, offset, data):
+        return self.client.patch(
+            reverse('posts:upload_session', args=(session_id,)),
+            data,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def commit(self, session_id, text='Пост по частям'):
+        return self.client.post(
+            reverse('posts:upload_commit', args=(session_id,)),
+            {'text': text},
+        )
+
+    def test_chunks_commit_post(self):
+        """Картинка из нескольких частей становится картинкой поста"""
+        session_id = self.start().json()['id']
+        middle = len(self.content) // 2
+        first = self.send(session_id, 0, self.content[:middle])
+        self.assertEqual(first.json()['offset'], middle)
+        self.send(session_id, middle, self.content[middle:])
+        response = self.commit(session_id)
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get()
+        self.assertEqual(response.json()['id'], post.pk)
+        self.assertEqual(post.author, ChunkedUploadTest.user)
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+        with post.image.open('rb') as image:
+            self.assertEqual(image.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.listdir(
+            os.path.join(TEMP_MEDIA_ROOT, settings.UPLOAD_SESSIONS_DIR)
+        ))
+
+    def test_resume_after_wrong_offset(self):
+        """Часть с чужим смещением — 409 с принятым смещением"""
+        session_id = self.start().json()['id']
+        self.send(session_id, 0, self.content[:10])
+        response = self.send(session_id, 20, self.content[20:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 10)
+        state = self.client.get(
+            reverse('posts:upload_session', args=(session_id,))
+        )
+        self.assertEqual(state.json()['offset'], 10)
+        self.send(session_id, 10, self.content[10:])
+        self.assertEqual(self.commit(session_id).status_code, 201)
+
+    def test_parallel_chunk_rejected(self):
+        """Пока файл сессии пишет другой запрос, часть с тем же
+        смещением получает 409 и файл не трогает"""
+        session_id = self.start().json()['id']
+        self.send(session_id, 0, self.content[:10])
+        session = UploadSession.objects.get(pk=session_id)
+        with open(session_path(session), 'r+b') as part:
+            locks.lock(part, locks.LOCK_EX)
+            response = self.send(session_id, 10, b'x' * 10)
+            locks.unlock(part)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 10)
+        self.send(session_id, 10, self.content[10:])
+        self.assertEqual(self.commit(session_id).status_code, 201)
+        with Post.objects.get().image.open('rb') as image:
+            self.assertEqual(image.read(), self.content)
+
+    def test_incomplete_commit_rejected(self):
+        """Недокачанный файл нельзя прикрепить к посту"""
+        session_id = self.start().json()['id']
+        self.send(session_id, 0, self.content[:10])
+        response = self.commit(session_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Post.objects.exists())
+
+    def test_chunk_past_declared_size(self):
+        """Данные сверх объявленного размера не принимаются"""
+        session_id = self.start().json()['id']
+        response = self.send(session_id, 0, self.content + b'lots')
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(POST_IMAGE_MAX_BYTES=50)
+    def test_declared_size_limit(self):
+        """Сессию на файл больше лимита не открыть"""
+        response = self.start(size=51)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size', response.json()['errors'])
+
+    def test_invalid_image_keeps_session(self):
+        """Не картинка даёт ошибку формы, а сессия остаётся"""
+        session_id = self.start(size=4).json()['id']
+        self.send(session_id, 0, b'oops')
+        response = self.commit(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json()['errors'])
+        self.assertTrue(UploadSession.objects.filter(pk=session_id).exists())
+
+    def test_foreign_and_expired_sessions_hidden(self):
+        """Чужая и просроченная сессии не находятся"""
+        session_id = self.start().json()['id']
+        other = Client()
+        other.force_login(User.objects.create_user(username='other'))
+        url = reverse('posts:upload_session', args=(session_id,))
+        self.assertEqual(other.get(url).status_code, 404)
+        UploadSession.objects.update(
+            created=timezone.now() - timedelta(
+                seconds=settings.UPLOAD_SESSION_TTL + 1
+            )
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cancel_removes_file(self):
+        """Отмена удаляет сессию вместе с файлом"""
+        session_id = self.start().json()['id']
+        self.send(session_id, 0, self.content[:10])
+        session = UploadSession.objects.get()
+        self.assertTrue(os.path.exists(session_path(session)))
+        self.client.delete(
+            reverse('posts:upload_session', args=(session_id,))
+        )
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(session_path(session)))
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from posts import thumbnails
+from posts.models import Post, UploadSession, User
+from posts.tests.utils import image_upload
+from posts.uploads import session_path
+from sorl.thumbnail import default
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def files(directory):
+    found = []
+    for root, _, names in os.walk(os.path.join(TEMP_MEDIA_ROOT, directory)):
+        found.extend(os.path.join(root, name) for name in names)
+    return found
+
+
+def age_media():
+    """Делает все файлы медиа старше --min-age по умолчанию."""
+    past = time.time() - 2 * 60 * 60
+    for path in files(''):
+        os.utime(path, (past, past))
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class CollectMediaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        default.kvstore.lru.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.author = User.objects.create_user(username='author')
+        # В TestCase on_commit не срабатывает: миниатюры строим сами, а
+        # удаление поста оставляет его файлы, как упавший воркер.
+        self.kept = self.create(10)
+        self.deleted = self.create(20)
+        self.deleted_name = self.deleted.image.name
+        self.deleted.delete()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, shade):
+        post = Post.objects.create(
+            author=self.author, text='Пост',
+            image=image_upload((8, 4), color=(shade, 0, 0)),
+        )
+        thumbnails.generate(post.image.name)
+        return post
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', '--pause=0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_without_deleting(self):
+        """Пробный прогон считает освобождаемое место и ничего не трогает"""
+        age_media()
+        before = files('')
+        output = self.collect('--dry-run')
+        self.assertIn('Оригиналы: файлов 1,', output)
+        count = len(thumbnails.presets())
+        self.assertIn(
+            f'Миниатюры удалённых картинок: файлов {count},', output
+        )
+        self.assertIn('Можно освободить:', output)
+        self.assertEqual(sorted(files('')), sorted(before))
+
+    def test_dry_run_matches_real_run(self):
+        """Пробный прогон обещает ровно столько, сколько освободит
+        настоящий"""
+        age_media()
+        dry = self.collect('--dry-run').splitlines()
+        real = self.collect().splitlines()
+        self.assertEqual(dry[:-1], real[:-1])
+        self.assertEqual(
+            dry[-1].replace('Можно освободить', 'Освобождено'), real[-1]
+        )
+
+    def test_orphans_deleted_referenced_kept(self):
+        """Удаляются только файлы и миниатюры удалённых постов"""
+        age_media()
+        thumbnails_before = len(files('cache'))
+        self.collect('--batch-size=2')
+        storage = thumbnails.image_storage()
+        self.assertFalse(storage.exists(self.deleted_name))
+        self.assertTrue(storage.exists(self.kept.image.name))
+        self.assertEqual(
+            len(files('cache')),
+            thumbnails_before - len(thumbnails.presets()),
+        )
+        self.assertIsNone(
+            default.kvstore.get(thumbnails.source_file(self.deleted_name))
+        )
+        self.assertIsNotNone(
+            default.kvstore.get(thumbnails.source_file(self.kept.image.name))
+        )
+
+    def test_unknown_thumbnail_file_deleted(self):
+        """Файл миниатюры без записи в KV-хранилище удаляется"""
+        KVStoreModel.objects.filter(key__contains='||image||').exclude(
+            value__contains='"posts/'
+        ).delete()
+        default.kvstore.lru.clear()
+        age_media()
+        self.collect()
+        self.assertFalse(files('cache'))
+
+    def test_fresh_files_kept(self):
+        """Файлы моложе --min-age не удаляются"""
+        self.collect()
+        storage = thumbnails.image_storage()
+        self.assertTrue(storage.exists(self.deleted_name))
+
+    def test_upload_sessions(self):
+        """Просроченные и брошенные загрузки удаляются вместе с файлами"""
+        expired = UploadSession.objects.create(
+            user=self.author, filename='a.png', size=10
+        )
+        UploadSession.objects.filter(pk=expired.pk).update(
+            created=expired.created.replace(year=2000)
+        )
+        active = UploadSession.objects.create(
+            user=self.author, filename='b.png', size=10
+        )
+        stray = UploadSession(pk=uuid.uuid4())
+        for session in (expired, active, stray):
+            os.makedirs(os.path.dirname(session_path(session)), exist_ok=True)
+            with open(session_path(session), 'wb') as part:
+                part.write(b'12345')
+        age_media()
+        output = self.collect()
+        self.assertIn('Просроченные загрузки: файлов 1, 5\xa0байт.', output)
+        self.assertIn('Брошенные загрузки: файлов 1, 5\xa0байт.', output)
+        self.assertEqual(
+            list(UploadSession.objects.values_list('pk', flat=True)),
+            [active.pk],
+        )
+        self.assertEqual(files(settings.UPLOAD_SESSIONS_DIR), [
+            session_path(active)
+        ])
@@ -0,0 +1,222 @@
+import threading
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts import events
+from posts.models import Comment, Post, User
+from posts.views import COMMENTS_IN_PAGE
+
+
+class CommentsPageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def comment(self, count):
+        start = Comment.objects.count()
+        for number in range(start, start + count):
+            Comment.objects.create(
+                post=CommentsPageTest.post,
+                author=User.objects.create_user(username=f'reader{number}'),
+                text=f'Комментарий {number}',
+            )
+
+    def count(self):
+        return Post.objects.values_list(
+            'comments_count', flat=True
+        ).get(pk=CommentsPageTest.post.pk)
+
+    def test_count_follows_comments(self):
+        """comments_count сдвигается при добавлении и удалении"""
+        self.comment(3)
+        self.assertEqual(self.count(), 3)
+        Comment.objects.first().delete()
+        self.assertEqual(self.count(), 2)
+
+    def test_stale_post_save_keeps_count(self):
+        """Правка прочитанного раньше поста не затирает счётчик"""
+        post = Post.objects.get(pk=CommentsPageTest.post.pk)
+        self.comment(2)
+        post.text = 'Правка'
+        post.save(update_fields=Post.EDIT_FIELDS)
+        self.assertEqual(self.count(), 2)
+
+    def test_edit_does_not_write_count(self):
+        """Страница правки не пишет comments_count"""
+        self.client.force_login(CommentsPageTest.author)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(
+                reverse('posts:post_edit', args=(CommentsPageTest.post.pk,)),
+                {'text': 'Правка'},
+            )
+        updates = [
+            query['sql'] for query in captured
+            if query['sql'].startswith('UPDATE "posts_post"')
+        ]
+        self.assertTrue(updates)
+        self.assertFalse(
+            [sql for sql in updates if '"comments_count"' in sql]
+        )
+
+    def test_detail_shows_first_page(self):
+        """Страница поста показывает первую порцию и ссылку на следующую"""
+        self.comment(COMMENTS_IN_PAGE + 5)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(CommentsPageTest.post.pk,))
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_IN_PAGE)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertTrue(comments.has_next)
+        self.assertContains(response, f'Комментарии: {COMMENTS_IN_PAGE + 5}')
+        self.assertContains(response, 'data-comments-more')
+
+    def test_fragment_continues_after_cursor(self):
+        """Фрагмент отдаёт комментарии после курсора без повторов"""
+        self.comment(COMMENTS_IN_PAGE + 5)
+        first = self.client.get(
+            reverse('posts:post_detail', args=(CommentsPageTest.post.pk,))
+        ).context['comments']
+        response = self.client.get(
+            reverse('posts:post_comments', args=(CommentsPageTest.post.pk,)),
+            {'after': first.paginator.next_cursor},
+        )
+        texts = [comment.text for comment in response.context['comments']]
+        self.assertEqual(texts, [
+            f'Комментарий {number}'
+            for number in range(COMMENTS_IN_PAGE, COMMENTS_IN_PAGE + 5)
+        ])
+        self.assertNotContains(response, 'data-comments-more')
+        self.assertNotContains(response, '<html')
+
+    def test_queries_do_not_grow_with_comments(self):
+        """Число запросов страницы не зависит от числа комментариев"""
+        url = reverse('posts:post_detail', args=(CommentsPageTest.post.pk,))
+        self.comment(3)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        self.comment(COMMENTS_IN_PAGE * 2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few), len(many))
+
+    def test_fragment_missing_post(self):
+        """Фрагмент несуществующего поста — 404"""
+        response = self.client.get(
+            reverse('posts:post_comments', args=(10 ** 6,))
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_recount_repairs_comments_count(self):
+        """recount_stats чинит разошедшийся comments_count"""
+        self.comment(2)
+        Post.objects.update(comments_count=9)
+        call_command('recount_stats', stdout=StringIO())
+        self.assertEqual(self.count(), 2)
+
+
+@override_settings(COMMENT_STREAM_TIMEOUT=0)
+class CommentStreamTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {n}'
+            )
+            for n in range(3)
+        ]
+
+    def stream(self, **extra):
+        response = self.client.get(
+            reverse('posts:comment_stream', args=(CommentStreamTest.post.pk,)),
+            **extra,
+        )
+        body = b''.join(response.streaming_content).decode()
+        response.close()
+        return response, body
+
+    def test_resume_from_last_event_id(self):
+        """Поток продолжается после Last-Event-ID"""
+        first = CommentStreamTest.comments[0]
+        response, body = self.stream(HTTP_LAST_EVENT_ID=str(first.pk))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(body.startswith('retry: '))
+        self.assertNotIn(f'id: {first.pk}\n', body)
+        for comment in CommentStreamTest.comments[1:]:
+            self.assertIn(f'id: {comment.pk}\nevent: comment\n', body)
+            self.assertIn(comment.text, body)
+
+    def test_page_resumes_stream_after_rendered_comment(self):
+        """Страница открывает поток по кнопке, начиная после последнего
+        показанного комментария: написанный до подключения не теряется"""
+        post = CommentStreamTest.post
+        stream_url = reverse('posts:comment_stream', args=(post.pk,))
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        last = CommentStreamTest.comments[-1]
+        follow_url = f'{stream_url}?last_event_id={last.pk}'
+        self.assertContains(response, f'data-comments-follow="{follow_url}"')
+        self.assertNotContains(response, f'EventSource("{stream_url}')
+        late = Comment.objects.create(
+            post=post, author=CommentStreamTest.author, text='Опоздавший'
+        )
+        stream = self.client.get(follow_url)
+        body = b''.join(stream.streaming_content).decode()
+        stream.close()
+        self.assertIn(f'id: {late.pk}\nevent: comment\n', body)
+        self.assertNotIn(f'id: {last.pk}\n', body)
+
+    def test_new_stream_skips_old_comments(self):
+        """Без Last-Event-ID поток начинается с новых комментариев"""
+        _, body = self.stream()
+        self.assertNotIn('event: comment', body)
+
+    @override_settings(
+        COMMENT_STREAM_TIMEOUT=0.2, COMMENT_STREAM_HEARTBEAT=0.05
+    )
+    def test_heartbeat_while_idle(self):
+        """В тишине поток шлёт пустые сообщения"""
+        _, body = self.stream()
+        self.assertIn(': heartbeat', body)
+
+    @override_settings(COMMENT_STREAMS_MAX=1)
+    def test_streams_capped(self):
+        """Сверх лимита потоков — 503, закрытый поток освобождает место"""
+        url = reverse(
+            'posts:comment_stream', args=(CommentStreamTest.post.pk,)
+        )
+        held = self.client.get(url)
+        busy = self.client.get(url)
+        self.assertEqual(busy.status_code, 503)
+        self.assertIn('Retry-After', busy)
+        held.close()
+        again = self.client.get(url)
+        again.close()
+        self.assertEqual(again.status_code, 200)
+
+    def test_bus_wakes_listener(self):
+        """Шина будит ожидающих только для своего поста"""
+        post_id = CommentStreamTest.post.pk
+        events.bus.subscribe(post_id)
+        self.addCleanup(events.bus.unsubscribe, post_id)
+        seen = events.bus.version(post_id)
+        self.assertFalse(events.bus.wait(post_id, seen, 0.01))
+        events.bus.notify(post_id + 1)
+        timer = threading.Timer(0.05, events.bus.notify, (post_id,))
+        timer.start()
+        self.assertTrue(events.bus.wait(post_id, seen, 5))
+        timer.join()
@@ -0,0 +1,122 @@
+import datetime
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from posts.caching import TAG_PREFIX
+from posts.filecache import FileBasedCache
+from posts.models import Comment, Group, Post, User
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.user = User.objects.create_user(username='mike')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост',
+            group=cls.group
+        )
+        cls.guest_client = Client()
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(ConditionalGetTest.user)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_pages_answer_not_modified(self):
+        """Повторный запрос с тем же ETag получает 304 без рендера"""
+        moment = timezone.now() + datetime.timedelta(seconds=2)
+
+        def later():
+            return moment
+
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries, \
+                        mock.patch.object(timezone, 'now', later):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                self.assertLessEqual(len(queries), 2)
+                self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_writes_change_validators(self):
+        """Новый пост или комментарий меняют ETag зависящих страниц"""
+        etags = {url: self.guest_client.get(url)['ETag'] for url in self.urls}
+        Comment.objects.create(post=self.post, author=self.user, text='К')
+        response = self.guest_client.get(
+            self.urls[3], HTTP_IF_NONE_MATCH=etags[self.urls[3]]
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        Post.objects.create(
+            author=self.author, group=self.group, text='Свежий пост'
+        )
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertContains(response, 'Свежий пост')
+
+    def test_no_last_modified_within_the_second_of_change(self):
+        """Пока не кончилась секунда изменения, Last-Modified не отдаётся,
+        и следующее изменение той же секунды не даст ложный 304"""
+        url = self.urls[0]
+        Post.objects.create(author=self.author, text='Только что')
+        response = self.guest_client.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_other_process_write_changes_validators(self):
+        """Версия тега, поднятая другим процессом, меняет ETag"""
+        url = self.urls[0]
+        etag = self.guest_client.get(url)['ETag']
+        other_process = FileBasedCache(
+            settings.CACHES['default']['LOCATION'], {}
+        )
+        other_process.set(f'{TAG_PREFIX}posts', 1e10, None)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_validators_are_per_user(self):
+        """ETag гостя не подходит залогиненному пользователю"""
+        url = self.urls[0]
+        etag = self.guest_client.get(url)['ETag']
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_missing_objects_still_404(self):
+        """Для несуществующих объектов валидаторов нет и отдаётся 404"""
+        for url in (
+            reverse('posts:group_list', kwargs={'slug': 'nope'}),
+            reverse('posts:profile', kwargs={'username': 'nobody'}),
+            reverse('posts:post_detail', kwargs={'post_id': 999}),
+        ):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+                self.assertFalse(response.has_header('ETag'))
@@ -1,7 +1,9 @@
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.db import IntegrityError, transaction
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from posts.models import Follow, Group, Post, User
+from posts import feed
+from posts.models import Follow, Group, Post, TimelineEntry, User
 
 
 class PostURLTest(TestCase):
@@ -121,3 +123,174 @@ class PostURLTest(TestCase):
                 user_id=PostURLTest.user1.pk
             ).exists()
         )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост автора попадает в ленту каждого подписчика"""
+        Follow.objects.create(
+            author=PostURLTest.author, user=PostURLTest.user1
+        )
+        Follow.objects.create(
+            author=PostURLTest.author, user=PostURLTest.user2
+        )
+        post = Post.objects.create(author=PostURLTest.author, text='Новый')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post=post).values_list(
+                'user_id', flat=True
+            )),
+            {PostURLTest.user1.pk, PostURLTest.user2.pk}
+        )
+
+    def test_follow_backfills_and_unfollow_prunes_timeline(self):
+        """Подписка наполняет ленту старыми постами, отписка очищает её"""
+        self.authorized_client1.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': PostURLTest.author.username}
+        ))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=PostURLTest.user1, post=PostURLTest.post
+        ).exists())
+        self.authorized_client1.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': PostURLTest.author.username}
+        ))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=PostURLTest.user1).exists()
+        )
+
+    def test_deleted_post_leaves_timeline(self):
+        """Удалённый пост пропадает из ленты подписчика"""
+        Follow.objects.create(
+            author=PostURLTest.author, user=PostURLTest.user1
+        )
+        post = Post.objects.create(
+            author=PostURLTest.author, text='Временный'
+        )
+        post.delete()
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertNotIn(post, response.context['page_obj'])
+        self.assertIn(PostURLTest.post, response.context['page_obj'])
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2)
+    def test_celebrity_posts_are_pulled_on_read(self):
+        """Посты знаменитости не копируются, но видны в ленте подписчика"""
+        for user in (PostURLTest.user1, PostURLTest.user2):
+            Follow.objects.create(author=PostURLTest.author, user=user)
+        Follow.objects.create(
+            author=PostURLTest.author2, user=PostURLTest.user1
+        )
+        celebrity_post = Post.objects.create(
+            author=PostURLTest.author, text='Пост знаменитости'
+        )
+        ordinary_post = Post.objects.create(
+            author=PostURLTest.author2, text='Обычный пост'
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=celebrity_post).exists()
+        )
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(Post.objects.filter(
+                author__following__user=PostURLTest.user1
+            ).order_by('-pub_date', '-pk'))
+        )
+        self.assertIn(celebrity_post, response.context['page_obj'])
+        self.assertIn(ordinary_post, response.context['page_obj'])
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2)
+    def test_former_celebrity_posts_stay_in_feed(self):
+        """Посты, написанные автором в статусе знаменитости, остаются в
+        ленте, когда он опускается ниже порога"""
+        for user in (PostURLTest.user1, PostURLTest.user2):
+            Follow.objects.create(author=PostURLTest.author, user=user)
+        celebrity_post = Post.objects.create(
+            author=PostURLTest.author, text='Пост знаменитости'
+        )
+        Follow.objects.filter(
+            author=PostURLTest.author, user=PostURLTest.user2
+        ).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=PostURLTest.user1, post=celebrity_post
+        ).exists())
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [celebrity_post, PostURLTest.post],
+        )
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=3)
+    def test_unfollow_crossing_threshold_fans_out(self):
+        """Догон срабатывает при переходе через порог, даже если отписка
+        перескочила его сразу на несколько подписчиков"""
+        celebrity_post = Post.objects.create(
+            author=PostURLTest.author, text='Пост знаменитости'
+        )
+        Follow.objects.create(
+            author=PostURLTest.author, user=PostURLTest.user1
+        )
+        # Пост написан, пока автор был знаменитостью, и не раскладывался.
+        TimelineEntry.objects.filter(post=celebrity_post).delete()
+        feed.unfollowed(PostURLTest.author.pk, 4, 3)
+        self.assertFalse(TimelineEntry.objects.filter(
+            post=celebrity_post
+        ).exists())
+        feed.unfollowed(PostURLTest.author.pk, 3, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=PostURLTest.user1, post=celebrity_post
+        ).exists())
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2, FEED_FAN_OUT_POSTS=1)
+    def test_former_celebrity_catch_up_is_capped(self):
+        """Бывшей знаменитости догоняются только последние посты"""
+        for user in (PostURLTest.user1, PostURLTest.user2):
+            Follow.objects.create(author=PostURLTest.author, user=user)
+        older, newer = (
+            Post.objects.create(author=PostURLTest.author, text=text)
+            for text in ('Старый пост', 'Новый пост')
+        )
+        Follow.objects.filter(
+            author=PostURLTest.author, user=PostURLTest.user2
+        ).delete()
+        timeline = TimelineEntry.objects.filter(user=PostURLTest.user1)
+        self.assertTrue(timeline.filter(post=newer).exists())
+        self.assertFalse(timeline.filter(post=older).exists())
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_merged_feed_pages_by_cursor(self):
+        """Слияние потоков листается курсором без повторов и пропусков"""
+        Follow.objects.create(
+            author=PostURLTest.author, user=PostURLTest.user1
+        )
+        for i in range(12):
+            Post.objects.create(
+                author=(PostURLTest.author, PostURLTest.author2)[i % 2],
+                text=f'Пост {i}'
+            )
+        TimelineEntry.objects.create(
+            user=PostURLTest.user1, author=PostURLTest.author,
+            post=PostURLTest.post, pub_date=PostURLTest.post.pub_date
+        )
+        Follow.objects.create(
+            author=PostURLTest.author2, user=PostURLTest.user1
+        )
+        url = reverse('posts:follow_index')
+        first = self.authorized_client1.get(url).context['page_obj']
+        second = self.authorized_client1.get(
+            url + '?after=' + first.paginator.next_cursor
+        ).context['page_obj']
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            list(Post.objects.order_by('-pub_date', '-pk')
+                 .values_list('pk', flat=True))
+        )
+
+    def test_follow_pair_is_unique(self):
+        """Повторная подписка на того же автора запрещена на уровне БД"""
+        Follow.objects.create(
+            author=PostURLTest.author, user=PostURLTest.user1
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(
+                author=PostURLTest.author, user=PostURLTest.user1
+            )
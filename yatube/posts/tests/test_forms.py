@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -13,6 +14,12 @@ TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
 
 
+def addressed_name(content, extension):
+    """Имя, под которым хранилище по содержимому сохранит картинку."""
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostURLTest(TestCase):
     @classmethod
@@ -77,7 +84,7 @@ class PostURLTest(TestCase):
             Post.objects.filter(
                 group=self.group.id,
                 text='Тестовый пост 2',
-                image='posts/small.gif'
+                image=addressed_name(small_gif, '.gif')
             ).exists()
         )
 
@@ -113,6 +120,6 @@ class PostURLTest(TestCase):
         self.assertTrue(
             Post.objects.filter(
                 text='Измененный тестовый пост',
-                image='posts/small2.gif'
+                image=addressed_name(small_gif, '.gif')
             ).exists()
         )
@@ -1,5 +1,7 @@
 from django.core.cache import cache
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from posts.models import Group, Post, User
 
@@ -82,3 +84,43 @@ class PaginatorViewsTest(TestCase):
             kwargs={'username': 'author'}
         ) + '?page=2')
         self.assertEqual(len(response.context['page_obj']), SECOND_PAGE)
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Проверка: курсоры ?after=/?before= листают ленту без пропусков."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        self.assertEqual(len(first), FIRST_PAGE)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+        second = self.authorized_client.get(
+            url + '?after=' + first.paginator.next_cursor
+        ).context['page_obj']
+        self.assertEqual(len(second), SECOND_PAGE)
+        self.assertFalse(second.has_next())
+        seen = [post.pk for post in first] + [post.pk for post in second]
+        self.assertEqual(
+            seen,
+            list(Post.objects.order_by('-pub_date', '-pk')
+                 .values_list('pk', flat=True))
+        )
+        back = self.authorized_client.get(
+            url + '?before=' + second.paginator.previous_cursor
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_cursor_page_skips_count_query(self):
+        """Проверка: курсорная страница не выполняет COUNT(*)."""
+        group_url = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(group_url)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        """Проверка: битый курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+            + '?after=%%%garbage'
+        )
+        self.assertEqual(len(response.context['page_obj']), FIRST_PAGE)
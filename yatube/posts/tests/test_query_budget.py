@@ -0,0 +1,50 @@
+import os
+from unittest import mock
+
+from django.test import TestCase
+from posts import querybudget
+
+
+class QueryBudgetTest(TestCase):
+    def test_routes_fit_query_budgets(self):
+        """Каждый именованный URL укладывается в бюджет запросов и времени.
+
+        Если бюджет вырос осознанно, обновите его командой
+        `python manage.py query_report --update`. На медленной машине
+        проверку времени выключает QUERY_BUDGET_TIME=0.
+        """
+        report = querybudget.collect()
+        problems = querybudget.violations(
+            report, querybudget.load_budgets(),
+            check_time=querybudget.time_check_enabled(),
+        )
+        self.assertEqual(problems, [], '\n'.join(problems))
+
+    def test_violations_report_overruns_and_missing_routes(self):
+        """Превышение и маршрут без бюджета попадают в отчёт."""
+        report = {
+            'posts:index': {'anonymous': {'queries': 5, 'ms': 10.0}},
+            'posts:new': {'anonymous': {'queries': 1, 'ms': 1.0}},
+        }
+        budgets = {'posts:index': {'anonymous': {'queries': 3, 'ms': 100}}}
+        self.assertEqual(
+            querybudget.violations(report, budgets),
+            [
+                'posts:index [anonymous]: queries 5 > 3',
+                'posts:new [anonymous]: нет бюджета',
+            ]
+        )
+
+    def test_time_check_can_be_switched_off(self):
+        """Превышение времени — нарушение, пока проверка не выключена."""
+        report = {'posts:index': {'anonymous': {'queries': 3, 'ms': 500.0}}}
+        budgets = {'posts:index': {'anonymous': {'queries': 3, 'ms': 100}}}
+        self.assertEqual(
+            querybudget.violations(report, budgets),
+            ['posts:index [anonymous]: ms 500.0 > 100'],
+        )
+        self.assertEqual(
+            querybudget.violations(report, budgets, check_time=False), []
+        )
+        with mock.patch.dict(os.environ, {querybudget.TIME_CHECK_ENV: '0'}):
+            self.assertFalse(querybudget.time_check_enabled())
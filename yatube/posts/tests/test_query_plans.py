@@ -0,0 +1,68 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from posts import queryplans
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Планы снимаются на SQLite')
+class QueryPlanTest(TestCase):
+    def test_hot_queries_keep_index_searches(self):
+        """Запросы горячих страниц не скатываются в SCAN по таблице.
+
+        Если план изменился осознанно, обновите снимок командой
+        `python manage.py query_plans --update`.
+        """
+        problems = queryplans.regressions(
+            queryplans.capture(), queryplans.load_snapshot()
+        )
+        self.assertEqual(problems, [], '\n'.join(problems))
+
+    def test_switch_from_search_to_scan_is_flagged(self):
+        """Переход таблицы с SEARCH на SCAN считается регрессией."""
+        sql = 'SELECT * FROM posts_post WHERE author_id = ?'
+        snapshot = {'profile': {sql: [
+            'SEARCH posts_post USING INDEX post_author_pub_date_idx '
+            '(author_id=?)',
+        ]}}
+        current = {'profile': {
+            sql: ['SCAN posts_post', 'USE TEMP B-TREE FOR ORDER BY'],
+            'SELECT * FROM posts_group': ['SCAN posts_group'],
+        }}
+        self.assertEqual(
+            queryplans.regressions(current, snapshot),
+            [
+                f'profile: posts_post -> SCAN posts_post\n    {sql}',
+                f'profile: появилась сортировка USE TEMP B-TREE\n    {sql}',
+                'profile: posts_group -> SCAN posts_group\n'
+                '    SELECT * FROM posts_group',
+            ]
+        )
+
+    def test_fingerprint_ignores_parameter_values(self):
+        """Запросы с разными значениями параметров узнаются как один."""
+        self.assertEqual(
+            queryplans.fingerprint(
+                "SELECT * FROM T4 WHERE slug = 'a''b' AND id IN (1, 22)"
+            ),
+            'SELECT * FROM T4 WHERE slug = ? AND id IN (...)'
+        )
+
+    def test_old_sqlite_plan_format(self):
+        """Планы старых SQLite с «TABLE» перед именем разбираются так же."""
+        old = queryplans.access_ranks([
+            'SEARCH TABLE posts_post USING INDEX post_author_pub_date_idx '
+            '(author_id=?)',
+            'SCAN TABLE posts_group',
+            'SEARCH TABLE auth_user USING INTEGER PRIMARY KEY (rowid=?)',
+        ])
+        new = queryplans.access_ranks([
+            'SEARCH posts_post USING INDEX post_author_pub_date_idx '
+            '(author_id=?)',
+            'SCAN posts_group',
+            'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)',
+        ])
+        self.assertEqual(old, new)
+        self.assertEqual(
+            set(old), {'posts_post', 'posts_group', 'auth_user'}
+        )
@@ -0,0 +1,97 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts import search as search_module
+from posts.models import Post, User
+from posts.search import match_query, search
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.rare = Post.objects.create(
+            author=cls.author, text='Кошка спит на окне'
+        )
+        cls.often = Post.objects.create(
+            author=cls.author, text='Кошка, кошка и ещё одна кошка'
+        )
+        cls.other = Post.objects.create(
+            author=cls.author, text='Собака гуляет во дворе'
+        )
+
+    def test_ranked_prefix_search(self):
+        """Слова ищутся по префиксу, частое совпадение выше"""
+        found = list(search('кошк'))
+        self.assertEqual(found, [SearchTest.often, SearchTest.rare])
+
+    def test_index_follows_save_and_delete(self):
+        """Правка и удаление поста сразу видны в поиске"""
+        post = Post.objects.get(pk=SearchTest.other.pk)
+        post.text = 'Теперь про кошку'
+        post.save()
+        self.assertIn(post, search('кошку'))
+        post.delete()
+        self.assertNotIn(SearchTest.other.pk, [p.pk for p in search('кошк')])
+
+    def test_query_syntax_not_executed(self):
+        """Операторы FTS5 в запросе считаются обычными словами"""
+        self.assertEqual(match_query('кошка OR "собака'), (
+            '"кошка"* "OR"* "собака"*'
+        ))
+        self.assertEqual(match_query('  ?!  '), None)
+        self.assertFalse(search('NEAR(кошка'))
+
+    def test_search_view_paginated(self):
+        """Страница поиска показывает найденное и сохраняет запрос"""
+        for number in range(12):
+            Post.objects.create(
+                author=SearchTest.author, text=f'Кошка номер {number}'
+            )
+        response = Client().get(reverse('posts:search'), {'q': 'кошка'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0')
+        empty = Client().get(reverse('posts:search'), {'q': 'жираф'})
+        self.assertContains(empty, 'Ничего не нашлось.')
+
+    def test_rebuild_command(self):
+        """rebuild_search находит посты, изменённые в обход сигналов"""
+        Post.objects.filter(pk=SearchTest.other.pk).update(text='Про жирафа')
+        self.assertFalse(search('жираф'))
+        out = StringIO()
+        call_command('rebuild_search', '--batch-size=2', stdout=out)
+        self.assertIn('Проиндексировано постов: 3.', out.getvalue())
+        self.assertEqual(list(search('жираф')), [SearchTest.other])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через FTS5, а не LIKE"""
+        model_admin = site._registry[Post]
+        request = RequestFactory().get('/')
+        with CaptureQueriesContext(connection) as captured:
+            queryset, _ = model_admin.get_search_results(
+                request, Post.objects.all(), 'собака'
+            )
+            found = list(queryset)
+        self.assertEqual(found, [SearchTest.other])
+        self.assertNotIn('LIKE', captured[0]['sql'])
+        self.assertIn('MATCH', captured[0]['sql'])
+
+    def test_without_fts5_falls_back_to_icontains(self):
+        """Без FTS5 поиск идёт через icontains, сигналы индекс не трогают"""
+        with mock.patch.object(
+            search_module, '_sqlite_has_fts5', return_value=False
+        ), CaptureQueriesContext(connection) as captured:
+            post = Post.objects.get(pk=SearchTest.other.pk)
+            post.text = 'Собака и кошка'
+            post.save()
+            found = list(search('кошка'))
+        self.assertEqual(set(found), {SearchTest.often, post})
+        self.assertFalse(
+            [query for query in captured if 'posts_post_fts' in query['sql']]
+        )
@@ -0,0 +1,107 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts import feed
+from posts.models import Follow, Group, GroupStats, Post, User, UserStats
+from posts.stats import group_stats, user_stats
+
+
+class StatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.user = User.objects.create_user(username='mike')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.group2 = Group.objects.create(
+            title='Тестовая группа2',
+            slug='test-slug2',
+            description='Тестовое описание2',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост',
+            group=cls.group
+        )
+        cls.guest_client = Client()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_follow_posts_and_follows(self):
+        """Счётчики сдвигаются при создании и удалении постов и подписок"""
+        self.assertEqual(user_stats(StatsTest.author.pk).posts_count, 1)
+        self.assertEqual(group_stats(StatsTest.group.pk).posts_count, 1)
+        post = Post.objects.create(
+            author=StatsTest.author, text='Ещё пост', group=StatsTest.group
+        )
+        follow = Follow.objects.create(
+            author=StatsTest.author, user=StatsTest.user
+        )
+        author_stats = UserStats.objects.get(user=StatsTest.author)
+        self.assertEqual(author_stats.posts_count, 2)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(user_stats(StatsTest.user.pk).following_count, 1)
+        post.group = StatsTest.group2
+        post.save()
+        self.assertEqual(group_stats(StatsTest.group.pk).posts_count, 1)
+        self.assertEqual(group_stats(StatsTest.group2.pk).posts_count, 1)
+        post.delete()
+        follow.delete()
+        author_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 0)
+
+    def test_failed_save_keeps_counters(self):
+        """Если обработчик после сдвига счётчика упал, откатываются и
+        запись, и сдвиг"""
+        user_stats(StatsTest.author.pk)
+        with mock.patch.object(
+            feed, 'fan_out_post', side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            Post.objects.create(author=StatsTest.author, text='Сбой')
+        self.assertFalse(Post.objects.filter(text='Сбой').exists())
+        self.assertEqual(user_stats(StatsTest.author.pk).posts_count, 1)
+
+    def test_profile_and_detail_read_counters(self):
+        """Профиль и страница поста берут число постов из счётчика"""
+        user_stats(StatsTest.author.pk)
+        UserStats.objects.filter(user=StatsTest.author).update(
+            posts_count=42
+        )
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        self.assertEqual(response.context['count'], 42)
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': StatsTest.post.pk})
+        )
+        self.assertContains(response, '42')
+
+    def test_recount_stats_repairs_drift(self):
+        """Команда recount_stats находит и исправляет расхождения"""
+        user_stats(StatsTest.author.pk)
+        group_stats(StatsTest.group.pk)
+        UserStats.objects.filter(user=StatsTest.author).update(
+            posts_count=7, followers_count=3
+        )
+        GroupStats.objects.filter(group=StatsTest.group).update(
+            posts_count=0
+        )
+        out = StringIO()
+        call_command('recount_stats', '--dry-run', stdout=out)
+        self.assertIn('авторов 1, групп 1', out.getvalue())
+        self.assertEqual(user_stats(StatsTest.author.pk).posts_count, 7)
+        call_command('recount_stats', stdout=StringIO())
+        author_stats = user_stats(StatsTest.author.pk)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(group_stats(StatsTest.group.pk).posts_count, 1)
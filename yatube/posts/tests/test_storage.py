@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from posts.models import Post, User
+from posts.storage import ContentAddressedStorage, is_addressed
+from posts.tests.utils import SMALL_GIF, upload
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def original_exists(name):
+    return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+
+def age(name):
+    """Сдвигает дату изменения файла за MEDIA_GRACE_PERIOD."""
+    moment = time.time() - settings.MEDIA_GRACE_PERIOD - 1
+    os.utime(os.path.join(TEMP_MEDIA_ROOT, name), (moment, moment))
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class ContentAddressedStorageTest(TransactionTestCase):
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки лежат одним файлом в шардированном каталоге"""
+        first = Post.objects.create(
+            author=self.author, text='Пост', image=upload('one.gif')
+        )
+        second = Post.objects.create(
+            author=self.author, text='Копия', image=upload('two.GIF')
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_addressed(first.image.name))
+        self.assertRegex(
+            first.image.name, r'^posts/([0-9a-f]{2})/([0-9a-f]{2})/\1\2'
+        )
+        shard = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(shard), [
+            os.path.basename(first.image.name)
+        ])
+
+    def test_file_removed_with_last_reference(self):
+        """Файл удаляется вместе с последним ссылающимся постом"""
+        first = Post.objects.create(
+            author=self.author, text='Пост', image=upload()
+        )
+        second = Post.objects.create(
+            author=self.author, text='Копия', image=upload()
+        )
+        name = first.image.name
+        first.delete()
+        self.assertTrue(original_exists(name))
+        age(name)
+        second.delete()
+        self.assertFalse(original_exists(name))
+
+    def test_fresh_duplicate_survives_last_reference(self):
+        """Файл, который только что загрузили снова, не удаляется вместе
+        с последним постом: новая ссылка на него ещё не закоммичена"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', image=upload()
+        )
+        name = post.image.name
+        age(name)
+        storage = Post._meta.get_field('image').storage
+        self.assertEqual(storage.save('posts/again.gif', upload()), name)
+        post.delete()
+        self.assertTrue(original_exists(name))
+
+    def test_storage_deconstructs(self):
+        """Хранилище сериализуется в миграции по пути класса"""
+        path, args, kwargs = ContentAddressedStorage().deconstruct()
+        self.assertEqual(path, 'posts.storage.ContentAddressedStorage')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class MigrateMediaCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_legacy_files_moved_in_batches(self):
+        """Команда переносит старые файлы и переписывает пути постов"""
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        legacy = FileSystemStorage(location=TEMP_MEDIA_ROOT)
+        legacy.save('posts/legacy.gif', ContentFile(SMALL_GIF))
+        legacy.save('posts/copy.gif', ContentFile(SMALL_GIF))
+        author = User.objects.create_user(username='author')
+        for name in ('posts/legacy.gif', 'posts/legacy.gif',
+                     'posts/copy.gif'):
+            Post.objects.create(author=author, text='Пост', image=name)
+        with self.assertLogs('posts.thumbnails', 'WARNING'):
+            Post.objects.create(
+                author=author, text='Пост', image='posts/missing.gif'
+            )
+        out = StringIO()
+        call_command('migrate_media', '--dry-run', stdout=out)
+        self.assertIn('Нужно перенести файлов: 2', out.getvalue())
+        self.assertTrue(original_exists('posts/legacy.gif'))
+        out = StringIO()
+        call_command('migrate_media', '--batch-size=1', stdout=out)
+        self.assertIn(
+            'Перенесено файлов: 2, обновлено постов: 3, '
+            'не найдено файлов: 1.', out.getvalue()
+        )
+        names = set(
+            Post.objects.exclude(image='posts/missing.gif').values_list(
+                'image', flat=True
+            )
+        )
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(is_addressed(name))
+        self.assertTrue(original_exists(name))
+        self.assertFalse(original_exists('posts/legacy.gif'))
+        self.assertFalse(original_exists('posts/copy.gif'))
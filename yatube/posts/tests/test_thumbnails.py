@@ -0,0 +1,361 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from posts.kvstore import LRU, KVStore
+from posts.models import Post, User
+from posts.tests.utils import upload
+from posts.thumbnails import (drain, negotiate, presets, resolve,
+                              thumbnail_counters)
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def reset():
+    cache.clear()
+    default.kvstore.lru.clear()
+
+
+def thumbnail_files():
+    found = []
+    for _, _, files in os.walk(os.path.join(TEMP_MEDIA_ROOT, 'cache')):
+        found.extend(files)
+    return found
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class ThumbnailSignalTest(TransactionTestCase):
+    def setUp(self):
+        reset()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_thumbnails_ready_after_save(self):
+        """После сохранения поста шаблону остаётся найти готовую миниатюру"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', image=upload()
+        )
+        self.assertEqual(len(thumbnail_files()), len(presets()))
+        create = 'sorl.thumbnail.base.ThumbnailBackend._create_thumbnail'
+        with mock.patch(create) as created:
+            for geometry, options in presets():
+                get_thumbnail(post.image, geometry, **options)
+        created.assert_not_called()
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_pool_builds_after_request(self):
+        """Запрос не ждёт пул, а пул строит миниатюры созданного поста"""
+        client = Client()
+        client.force_login(self.author)
+        with mock.patch('posts.thumbnails.wait') as waited:
+            client.post(
+                reverse('posts:create'),
+                data={'text': 'Пост', 'image': upload()},
+            )
+        waited.assert_not_called()
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        drain(timeout=10)
+        self.assertEqual(len(thumbnail_files()), len(presets()))
+
+    def test_backend_names_thumbnail_like_sorl(self):
+        """Бэкенд называет миниатюру так же, как её строит sorl"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', image=upload()
+        )
+        for geometry, options in presets():
+            self.assertEqual(
+                default.backend.thumbnail_file(
+                    post.image, geometry, options
+                ).name,
+                get_thumbnail(post.image, geometry, **options).name,
+            )
+
+    def test_unchanged_image_not_requeued(self):
+        """Правка текста без новой картинки не ставит её в очередь"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', image=upload()
+        )
+        with mock.patch('posts.thumbnails.submit') as submit:
+            post.text = 'Изменённый пост'
+            post.save()
+            submit.assert_not_called()
+            post.image = upload('other.gif', shade=0x80)
+            post.save()
+            submit.assert_called_once_with(post.image.name)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class BuildThumbnailsCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_backfill_existing_posts(self):
+        """Команда строит миниатюры для уже загруженных картинок"""
+        reset()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(
+            author=author, text='Пост', image=upload()
+        )
+        Post.objects.create(author=author, text='Без картинки')
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_placeholder=''
+        )
+        self.assertEqual(thumbnail_files(), [])
+        out = StringIO()
+        call_command('build_thumbnails', stdout=out)
+        self.assertIn('Обработано картинок: 1.', out.getvalue())
+        self.assertIn('Заполнено превью: 1.', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(len(thumbnail_files()), len(presets()))
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class ResolveThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        for number in range(3):
+            Post.objects.create(
+                author=cls.author, text=f'Пост {number}',
+                image=upload(f'small{number}.gif', shade=number),
+            )
+        Post.objects.create(author=cls.author, text='Без картинки')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_page_resolved_in_one_batch(self):
+        """Метаданные миниатюр страницы берутся одним запросом к таблице"""
+        reset()
+        resolve(list(Post.objects.all()))
+        self.assertEqual(thumbnail_counters()['miss'], 3)
+        reset()
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            resolve(posts)
+        self.assertEqual(thumbnail_counters()['db'], 3)
+        with self.assertNumQueries(0):
+            resolve(posts)
+        self.assertEqual(
+            thumbnail_counters(), {'hit': 3, 'db': 3, 'miss': 0}
+        )
+        for post in posts:
+            if post.image:
+                self.assertIn('/cache/', post.thumbnail.url)
+            else:
+                self.assertIsNone(post.thumbnail)
+
+    def test_index_shows_resolved_thumbnails(self):
+        """Главная страница выводит миниатюры, найденные пакетом"""
+        reset()
+        response = Client().get(reverse('posts:index'))
+        self.assertEqual(response.content.decode().count('card-img'), 3)
+
+
+class LRUTest(TestCase):
+    def test_bounded_and_expiring(self):
+        """LRU вытесняет давно не читанные и просроченные записи"""
+        lru = LRU(size=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        expired = LRU(size=2, timeout=-1)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class SharedKVStoreTest(TransactionTestCase):
+    def setUp(self):
+        reset()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            author=self.author, text='Пост', image=upload()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_new_process_finds_thumbnails(self):
+        """Другой процесс находит миниатюры в общей таблице и прогревается"""
+        store = KVStore()
+        with override_settings(THUMBNAIL_WARM_UP=10):
+            with self.assertNumQueries(2):
+                store.warm_up()
+        self.assertEqual(len(store.lru), len(presets()))
+        with self.assertNumQueries(0):
+            resolve([self.post])
+        self.assertIn('/cache/', self.post.thumbnail.url)
+
+    def test_deleted_post_evicted(self):
+        """Удаление поста убирает его миниатюры из таблицы, LRU и диска"""
+        self.assertTrue(KVStoreModel.objects.exists())
+        self.post.delete()
+        self.assertFalse(KVStoreModel.objects.exists())
+        self.assertEqual(len(default.kvstore.lru), 0)
+        self.assertEqual(thumbnail_files(), [])
+
+    def test_shared_image_kept(self):
+        """Миниатюры картинки остаются, пока на неё ссылается другой пост"""
+        Post.objects.create(
+            author=self.author, text='Копия', image=self.post.image.name
+        )
+        self.post.delete()
+        self.assertTrue(KVStoreModel.objects.exists())
+        self.assertEqual(len(thumbnail_files()), len(presets()))
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class ImageVariantsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', image=upload()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        reset()
+
+    def image_url(self, width):
+        return reverse(
+            'posts:post_image', args=[width, ImageVariantsTest.post.image]
+        )
+
+    @override_settings(POST_IMAGE_FORMATS=('PNG', 'JPEG'))
+    def test_negotiate_by_accept(self):
+        """Формат выбирается по Accept, без него — запасной"""
+        self.assertEqual(negotiate('image/png,image/*;q=0.8'), 'PNG')
+        self.assertEqual(negotiate('image/*,*/*;q=0.8'), 'JPEG')
+        self.assertEqual(negotiate(''), 'JPEG')
+        response = self.client.get(
+            self.image_url(320), HTTP_ACCEPT='image/png,*/*'
+        )
+        self.assertEqual(response['Content-Type'], 'image/png')
+        response = self.client.get(self.image_url(320), HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_unknown_variant_not_found(self):
+        """Чужие ширины и картинки без поста не отдаются"""
+        self.assertEqual(self.client.get(self.image_url(123)).status_code, 404)
+        missing = reverse('posts:post_image', args=[320, 'posts/none.gif'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_srcset_in_feed(self):
+        """srcset перечисляет ширины не больше самой картинки"""
+        content = self.client.get(reverse('posts:index')).content.decode()
+        self.assertIn(f'{self.image_url(320)} 320w', content)
+        self.assertNotIn(f'{self.image_url(640)} 640w', content)
+        Post.objects.filter(pk=ImageVariantsTest.post.pk).update(
+            image_width=2000
+        )
+        reset()
+        content = self.client.get(reverse('posts:index')).content.decode()
+        for width in settings.POST_IMAGE_WIDTHS:
+            self.assertIn(f'{self.image_url(width)} {width}w', content)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class PlaceholderTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        reset()
+
+    def test_placeholder_follows_image(self):
+        """Размеры и превью считаются при загрузке и сбрасываются с ней"""
+        post = Post.objects.create(
+            author=PlaceholderTest.author, text='Пост', image=upload()
+        )
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        placeholder = post.image_placeholder
+        post.text = 'Изменённый пост'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_placeholder, placeholder)
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_unreadable_image_skipped(self):
+        """Битая картинка не мешает сохранить пост"""
+        with self.assertLogs('posts.thumbnails', 'WARNING'):
+            post = Post.objects.create(
+                author=PlaceholderTest.author, text='Пост',
+                image='posts/missing.gif',
+            )
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_feed_inlines_placeholder(self):
+        """Лента встраивает превью и откладывает загрузку нижних картинок"""
+        for number in range(2):
+            Post.objects.create(
+                author=PlaceholderTest.author, text=f'Пост {number}',
+                image=upload(f'small{number}.gif', shade=number),
+            )
+        content = self.client.get(reverse('posts:index')).content.decode()
+        self.assertEqual(content.count('data:image/jpeg;base64,'), 2)
+        self.assertEqual(content.count('loading="lazy"'), 1)
+        self.assertIn('width="960" height="339"', content)
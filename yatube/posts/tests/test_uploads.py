@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from posts.models import Post, User
+from posts.tests.utils import image_bytes, image_upload
+from posts.uploads import BoundedUploadHandler, dimensions
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, THUMBNAIL_WARM_UP=0
+)
+class BoundedUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='mike')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(BoundedUploadTest.user)
+
+    def create(self, image):
+        return self.client.post(
+            reverse('posts:create'), data={'text': 'Пост', 'image': image}
+        )
+
+    @override_settings(POST_IMAGE_MAX_BYTES=50)
+    def test_byte_limit(self):
+        """Файл больше лимита отклоняется с понятной ошибкой"""
+        response = self.create(image_upload((64, 64)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 50\xa0байт.'
+        )
+        self.assertEqual(response.context['form']['text'].value(), 'Пост')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_BYTES=50)
+    def test_reading_stops_at_limit(self):
+        """После лимита обработчик не дочитывает тело запроса"""
+        request = RequestFactory().post('/')
+        handler = BoundedUploadHandler(request)
+        handler.new_file('image', 'image.png', 'image/png', None)
+        handler.receive_data_chunk(b'x' * 40, 0)
+        with self.assertRaises(StopUpload) as caught:
+            handler.receive_data_chunk(b'x' * 40, 40)
+        self.assertTrue(caught.exception.connection_reset)
+        self.assertEqual(request.rejected_upload.size, 80)
+
+    @override_settings(
+        POST_IMAGE_MAX_BYTES=50, DATA_UPLOAD_MAX_MEMORY_SIZE=100
+    )
+    def test_oversized_body_rejected_before_reading(self):
+        """Тело заведомо больше лимита отклоняется по Content-Length до
+        чтения файла, а введённый текст остаётся в форме"""
+        response = self.create(image_upload((64, 64)))
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 50\xa0байт.'
+        )
+        request = response.wsgi_request
+        self.assertEqual(
+            request.rejected_upload.size, int(request.META['CONTENT_LENGTH'])
+        )
+        self.assertEqual(response.context['form']['text'].value(), 'Пост')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=300)
+    def test_pixel_limit(self):
+        """Картинка с избытком пикселей отклоняется по заголовку"""
+        response = self.create(image_upload((20, 20)))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка 20×20 больше 0 мегапикселей.'
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIDE=16)
+    def test_oversized_original_downscaled(self):
+        """Длинная сторона оригинала уменьшается до лимита"""
+        self.create(image_upload((64, 32), 'JPEG', 'photo.jpg'))
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (16, 8))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_dimensions_from_header(self):
+        """Размеры читаются из заголовка без данных пикселей"""
+        content = image_bytes((4000, 3000), 'JPEG')[:1024]
+        header = SimpleUploadedFile('big.jpg', content, 'image/jpeg')
+        self.assertEqual(dimensions(header), (4000, 3000, 'JPEG'))
@@ -4,9 +4,11 @@ import tempfile
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Group, Post, User
+from posts.models import Comment, Follow, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -156,3 +158,62 @@ class PostURLTest(TestCase):
         ))
         first_object = response.context.get('form')
         self.assertIsNotNone(first_object)
+
+
+class QueryCountTest(TestCase):
+    """Число запросов на страницу не зависит от числа постов на ней."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.client_reader = Client()
+        cls.client_reader.force_login(cls.reader)
+        cls.post = None
+        cls.post = cls.add_posts(1)
+
+    @classmethod
+    def add_posts(cls, count, author=None, group=None):
+        """Добавляет count постов; без author и group у каждого поста
+        новые автор и группа."""
+        for _ in range(count):
+            number = Post.objects.count()
+            post_author = author or User.objects.create_user(
+                username=f'author{number}', first_name=f'Имя{number}'
+            )
+            post_group = group or Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{number}',
+                description='Описание',
+            )
+            if author is None:
+                Follow.objects.create(user=cls.reader, author=post_author)
+            post = Post.objects.create(
+                author=post_author, group=post_group, text='Т'
+            )
+            Comment.objects.create(
+                post=cls.post or post, author=post_author, text='К'
+            )
+        return post
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client_reader.get(url)
+        return len(queries)
+
+    def test_query_count_is_constant_per_page(self):
+        """Страницы со списками и комментариями не делают N+1 запросов."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:follow_index'),
+            reverse('posts:group_list', kwargs={'slug': 'group-0'}),
+            reverse('posts:profile', kwargs={'username': 'author0'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        before = {url: self.count_queries(url) for url in urls}
+        # Лента группы и профиль заполняются постами той же группы и того
+        # же автора, главная и подписки — постами разных авторов и групп.
+        self.add_posts(9, self.post.author, self.post.group)
+        self.add_posts(9)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), before[url])
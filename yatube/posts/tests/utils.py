@@ -0,0 +1,37 @@
+"""Картинки для тестов загрузок, хранилища и миниатюр."""
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def upload(name='small.gif', shade=0xFF):
+    """GIF 2x1; разные shade дают разное содержимое и разные имена."""
+    content = SMALL_GIF[:16] + bytes([shade] * 3) + SMALL_GIF[19:]
+    return SimpleUploadedFile(
+        name=name, content=content, content_type='image/gif'
+    )
+
+
+def image_bytes(size, image_format='PNG', color=(200, 30, 30)):
+    """Картинка size, закодированная в image_format."""
+    buffer = BytesIO()
+    Image.new('RGB', size, color=color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def image_upload(size, image_format='PNG', name='image.png',
+                 color=(200, 30, 30)):
+    return SimpleUploadedFile(
+        name=name, content=image_bytes(size, image_format, color),
+        content_type=f'image/{image_format.lower()}',
+    )
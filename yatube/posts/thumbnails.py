@@ -0,0 +1,347 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Шаблоны вызывают `{% thumbnail %}` с геометриями из
+settings.POST_THUMBNAILS. Миниатюры для них строятся после коммита
+сохранения поста в пуле потоков, поэтому при показе страницы sorl
+находит готовый файл в своём KV-хранилище и не декодирует исходник
+внутри запроса.
+
+Запрос, сохранивший пост, пул не ждёт и поток сервера сразу
+освобождает. Если страница, на которую ведёт редирект, опередит пул,
+недостающую миниатюру она построит сама, как это сделал бы
+{% thumbnail %}. Дождаться пула можно через drain() — это нужно тестам и
+командам.
+
+Страница ленты получает метаданные миниатюр всех своих постов разом
+через resolve(): одна проверка LRU и один запрос к таблице KV-хранилища
+(posts.kvstore) вместо отдельного обращения на каждую карточку.
+"""
+import base64
+import logging
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+
+from .caching import cache_counters, count_event
+from .models import Post
+from .storage import is_addressed
+
+logger = logging.getLogger(__name__)
+
+COUNTER_PREFIX = 'thumbnails:'
+COUNTER_EVENTS = ('hit', 'db', 'miss')
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+}
+
+
+def formats():
+    """Форматы вариантов из POST_IMAGE_FORMATS, которые умеет кодировать
+    установленный Pillow, в порядке предпочтения."""
+    Image.init()
+    return [
+        name for name in settings.POST_IMAGE_FORMATS if name in Image.SAVE
+    ]
+
+
+def negotiate(accept):
+    """Лучший формат, явно названный в заголовке Accept, иначе последний
+    из форматов — запасной, который понимают все браузеры."""
+    available = formats()
+    for name in available[:-1]:
+        if MIME_TYPES[name] in accept:
+            return name
+    return available[-1]
+
+
+def variant_preset(width, image_format):
+    """Геометрия и опции варианта: пропорции первой миниатюры шаблонов,
+    без увеличения маленьких исходников."""
+    geometry, _ = settings.POST_THUMBNAILS[0]
+    base_width, base_height = map(int, geometry.split('x'))
+    height = round(width * base_height / base_width)
+    return f'{width}x{height}', {
+        'crop': 'center', 'upscale': False, 'format': image_format,
+    }
+
+
+def presets():
+    """Все миниатюры, которые строятся заранее: из шаблонов и варианты
+    для srcset во всех доступных форматах."""
+    variants = [
+        variant_preset(width, image_format)
+        for width in settings.POST_IMAGE_WIDTHS
+        for image_format in formats()
+    ]
+    return list(settings.POST_THUMBNAILS) + variants
+
+
+def image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def source_file(name):
+    # Ключ исходника в KV-хранилище включает класс хранилища, поэтому
+    # картинку по имени открываем тем же хранилищем, что и поле модели.
+    return ImageFile(name, image_storage())
+
+
+def generate(name):
+    """Строит все миниатюры картинки name; ошибки только логирует."""
+    for geometry, options in presets():
+        try:
+            get_thumbnail(source_file(name), geometry, **options)
+        except Exception:
+            logger.exception('Не удалось построить миниатюру %s', name)
+
+
+def _work(name):
+    close_old_connections()
+    try:
+        generate(name)
+    finally:
+        connection.close()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def submit(name):
+    """Ставит картинку в очередь; при THUMBNAIL_WORKERS = 0 строит сразу."""
+    if not settings.THUMBNAIL_WORKERS:
+        generate(name)
+        return None
+    future = executor().submit(_work, name)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_forget)
+    return future
+
+
+def _forget(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def schedule(post):
+    """Ставит картинку поста в очередь после коммита транзакции."""
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(lambda: submit(name))
+
+
+def schedule_eviction(name):
+    """Вычищает миниатюры удалённой картинки после коммита транзакции."""
+    if name:
+        transaction.on_commit(lambda: evict(name))
+
+
+def drain(timeout=None):
+    """Ждёт задачи, уже поставленные в пул, не дольше timeout секунд.
+
+    Запросы пул не ждут; ожидание нужно тестам и командам, которым
+    важно застать миниатюры готовыми.
+    """
+    with _pending_lock:
+        pending = list(_pending)
+    if pending:
+        wait(pending, timeout=timeout)
+
+
+def _thumbnail_file(source, geometry, options):
+    return default.backend.thumbnail_file(source, geometry, options)
+
+
+def _thumbnail_keys(names):
+    return [
+        add_prefix(_thumbnail_file(source_file(name), geometry, options).key)
+        for name in names
+        for geometry, options in presets()
+    ]
+
+
+def latest_keys(limit):
+    """Ключи KV-хранилища для миниатюр limit самых свежих постов."""
+    names = Post.objects.exclude(image='').order_by(
+        '-pub_date'
+    ).values_list('image', flat=True)[:limit]
+    return _thumbnail_keys(names)
+
+
+def evict(name):
+    """Удаляет миниатюры картинки name и их записи в KV-хранилище, если
+    на картинку больше не ссылается ни один пост.
+
+    Исходник с именем по содержимому удаляется вместе с ними: это была
+    последняя ссылка на него. Недавно сохранённый исходник остаётся: его
+    могла снова загрузить ещё не закоммиченная транзакция. Такие файлы и
+    старые файлы без хеша в имени оставлены сборщику мусора.
+    """
+    if not name or Post.objects.filter(image=name).exists():
+        return
+    default.kvstore.delete(source_file(name))
+    storage = image_storage()
+    if is_addressed(name) and not storage.recently_saved(name):
+        storage.delete(name)
+
+
+def orphan_sources(batch_size):
+    """Пачки исходников из KV-хранилища, на которые не ссылается ни один
+    пост: их миниатюры больше никто не покажет."""
+    kvstore = default.kvstore
+    prefix = add_prefix('', 'thumbnails')
+    for batch in kvstore.find_key_batches(prefix, batch_size):
+        keys = [add_prefix(del_prefix(key)) for key in batch]
+        values, _ = kvstore.get_raw_many(keys)
+        sources = [deserialize_image_file(value) for value in values.values()]
+        referenced = set(Post.objects.filter(
+            image__in=[source.name for source in sources]
+        ).values_list('image', flat=True))
+        orphans = [
+            source for source in sources if source.name not in referenced
+        ]
+        if orphans:
+            yield orphans
+
+
+def unknown_thumbnails(names, dropped=()):
+    """Имена файлов миниатюр из names, которых нет в KV-хранилище.
+
+    Ключи из dropped считаются уже снятыми: пробный прогон не удаляет
+    записи, но должен видеть хранилище таким, каким его оставит настоящий.
+    """
+    keys = {
+        add_prefix(ImageFile(name, default.storage).key): name
+        for name in names
+    }
+    values, _ = default.kvstore.get_raw_many(list(keys))
+    return [
+        name for key, name in keys.items()
+        if key not in values or key in dropped
+    ]
+
+
+def placeholder(image):
+    """Размеры картинки и её крошечное превью в data URI.
+
+    Превью обрезано под пропорции карточки ленты и весит несколько сотен
+    байт, так что его можно встроить прямо в страницу. Картинку, которую
+    не удалось прочитать, описывает (None, None, '').
+    """
+    geometry, _ = settings.POST_THUMBNAILS[0]
+    base_width, base_height = map(int, geometry.split('x'))
+    width = settings.POST_PLACEHOLDER_WIDTH
+    size = (width, max(1, round(width * base_height / base_width)))
+    try:
+        image.open('rb')
+        with Image.open(image) as source:
+            intrinsic = source.size
+            # JPEG декодируется сразу в уменьшенном масштабе.
+            source.draft('RGB', (size[0] * 4, size[1] * 4))
+            preview = ImageOps.fit(source.convert('RGB'), size)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        logger.warning('Не удалось прочитать картинку %s', image.name)
+        return None, None, ''
+    finally:
+        # Несохранённую загрузку Django ещё запишет в хранилище.
+        if image._committed:
+            image.close()
+        elif not image.closed:
+            image.seek(0)
+    buffer = BytesIO()
+    preview.save(buffer, 'JPEG', quality=60)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return intrinsic[0], intrinsic[1], f'data:image/jpeg;base64,{encoded}'
+
+
+def variant(name, width, image_format):
+    """Вариант картинки name шириной width в формате image_format.
+
+    Готовый вариант находится по KV-хранилищу без обращения к диску;
+    недостающий строится только для картинок, на которые ссылается
+    пост, иначе возвращается None.
+    """
+    geometry, options = variant_preset(width, image_format)
+    thumbnail = _thumbnail_file(source_file(name), geometry, options)
+    key = add_prefix(thumbnail.key)
+    values, _ = default.kvstore.get_raw_many([key])
+    if key in values:
+        return deserialize_image_file(values[key])
+    if not Post.objects.filter(image=name).exists():
+        return None
+    return get_thumbnail(source_file(name), geometry, **options)
+
+
+def _posts_by_thumbnail_key(posts, geometry, options):
+    """Посты с картинками, сгруппированные по ключу их миниатюры в
+    KV-хранилище; post.thumbnail пока сбрасывается в None."""
+    wanted = {}
+    for post in posts:
+        post.thumbnail = None
+        if post.image:
+            thumbnail = _thumbnail_file(
+                ImageFile(post.image), geometry, options
+            )
+            wanted.setdefault(add_prefix(thumbnail.key), []).append(post)
+    return wanted
+
+
+def resolve(posts, geometry=None, options=None):
+    """Проставляет post.thumbnail каждому посту из posts.
+
+    Без geometry берётся первая геометрия POST_THUMBNAILS. Миниатюры,
+    которых ещё нет в KV-хранилище, строятся на месте, как это сделал бы
+    {% thumbnail %}; у постов без картинки или с непрочитанной картинкой
+    thumbnail равен None.
+    """
+    if geometry is None:
+        geometry, options = presets()[0]
+    wanted = _posts_by_thumbnail_key(posts, geometry, options)
+    if not wanted:
+        return
+    values, hits = default.kvstore.get_raw_many(list(wanted))
+    misses = 0
+    for key, owners in wanted.items():
+        if key in values:
+            thumbnail = deserialize_image_file(values[key])
+        else:
+            misses += 1
+            thumbnail = get_thumbnail(owners[0].image, geometry, **options)
+            if thumbnail.size is None:
+                # Исходник не прочитался: показывать нечего.
+                thumbnail = None
+        for post in owners:
+            post.thumbnail = thumbnail
+    found = {'hit': hits, 'db': len(values) - hits, 'miss': misses}
+    for event, delta in found.items():
+        if delta:
+            count_event(event, COUNTER_PREFIX, delta)
+
+
+def thumbnail_counters():
+    """Сколько миниатюр нашлось в памяти, в таблице и было построено."""
+    return cache_counters(COUNTER_PREFIX, COUNTER_EVENTS)
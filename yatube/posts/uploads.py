@@ -0,0 +1,259 @@
+"""Загрузка картинок постов с ограниченным расходом памяти.
+
+Файлы загрузок всегда пишутся во временные файлы на диске, а не в
+память, и не дальше POST_IMAGE_MAX_BYTES: на превышении чтение тела
+запроса прекращается, и воркер не ждёт остаток передачи. Форма смотрит
+размеры картинки по заголовку, не декодируя пиксели, отклоняет картинки
+больше POST_IMAGE_MAX_PIXELS и уменьшает те, что длиннее
+POST_IMAGE_MAX_SIDE, декодируя JPEG сразу в уменьшенном масштабе
+(draft).
+
+Большие картинки можно загружать по частям (UploadSession): каждая часть
+дописывается прямо в файл сессии в MEDIA_ROOT/UPLOAD_SESSIONS_DIR с
+принятого смещения, так что оборванная загрузка продолжается с места
+обрыва, а воркер занят только на время одной части. Собранный файл
+проходит ту же PostForm, и хранилище перемещает его, а не копирует.
+"""
+import os
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (StopUpload,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+# Сколько байт тела запроса читать за раз при записи части.
+READ_SIZE = 64 * 1024
+
+# Форматы, которые Pillow умеет и читать, и записывать без потерь смысла.
+SAVE_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+
+class RejectedUpload(UploadedFile):
+    """Загрузка, которую BoundedUploadHandler перестал читать по лимиту."""
+    truncated = True
+
+    def __init__(self, name, size):
+        super().__init__(None, name, None, size)
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл не больше POST_IMAGE_MAX_BYTES.
+
+    Тело запроса дальше лимита не читается: разбор останавливается
+    (StopUpload с connection_reset), а у запроса, чей Content-Length
+    больше картинки и полей формы вместе взятых, разбор останавливается
+    на первом же файле. Поля формы перед файлом при этом разобраны, и
+    форма покажется снова с введённым текстом. Воркер освобождается
+    сразу; форма узнаёт о превышении через request_files.
+    """
+    oversized = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        fields_limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if (fields_limit is not None and content_length
+                > settings.POST_IMAGE_MAX_BYTES + fields_limit):
+            self.oversized = content_length
+        return None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        if self.oversized is not None:
+            self.request.rejected_upload = RejectedUpload(
+                file_name, self.oversized
+            )
+            raise StopUpload(connection_reset=True)
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.request.rejected_upload = RejectedUpload(
+                self.file_name, self.received
+            )
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+
+def request_files(request, field='image'):
+    """request.FILES для формы, или None, если файлов нет.
+
+    Загрузку, отклонённую BoundedUploadHandler, подставляет в field как
+    RejectedUpload: форма сообщит о размере, а не о пустом поле.
+    """
+    files = request.FILES
+    rejected = getattr(request, 'rejected_upload', None)
+    if rejected is not None:
+        files = files.copy()
+        files[field] = rejected
+    return files or None
+
+
+def dimensions(file):
+    """Ширина, высота и формат по заголовку; пиксели не декодируются."""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            return image.width, image.height, image.format
+    finally:
+        file.seek(0)
+
+
+def downscale(file, image_format, max_side):
+    """Копия картинки, вписанная в квадрат max_side, во временном файле.
+
+    JPEG декодируется сразу в уменьшенном масштабе (draft), поэтому
+    в памяти не оказывается полноразмерный растр.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        image.draft(image.mode, (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        # Обычный временный файл, а не TemporaryUploadedFile: хранилище
+        # скопирует его, а не переместит, и закрытие ничего не сломает.
+        result = tempfile.TemporaryFile()
+        options = {'quality': 90} if image_format == 'JPEG' else {}
+        image.save(result, image_format, **options)
+    size = result.tell()
+    result.seek(0)
+    return UploadedFile(result, file.name, file.content_type, size)
+
+
+def limit_image(upload):
+    """Проверяет новую загрузку по лимитам и при нужде уменьшает её.
+
+    Возвращает загрузку или её уменьшенную копию; превышение лимитов
+    байт и пикселей — ValidationError.
+    """
+    if (getattr(upload, 'truncated', False)
+            or upload.size > settings.POST_IMAGE_MAX_BYTES):
+        raise forms.ValidationError(
+            'Файл больше %(limit)s.',
+            code='too_large',
+            params={'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)},
+        )
+    width, height, image_format = dimensions(upload)
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise forms.ValidationError(
+            'Картинка %(width)s×%(height)s больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={
+                'width': width,
+                'height': height,
+                'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6,
+            },
+        )
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    if max(width, height) > max_side and image_format in SAVE_FORMATS:
+        return downscale(upload, image_format, max_side)
+    return upload
+
+
+class SessionFile(UploadedFile):
+    """Собранный файл сессии загрузки.
+
+    Отдаёт путь на диске, как TemporaryUploadedFile: ImageField проверяет
+    картинку по пути, а хранилище перемещает файл вместо копирования.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def session_path(session):
+    return os.path.join(
+        settings.MEDIA_ROOT,
+        settings.UPLOAD_SESSIONS_DIR,
+        f'{session.pk.hex}.part',
+    )
+
+
+class ChunkConflict(Exception):
+    """Часть не продолжает принятые данные: смещение сессии уже другое
+    или файл сессии сейчас пишет параллельный запрос."""
+
+
+def write_chunk(session, stream, offset, length):
+    """Пишет до length байт из stream в файл сессии с offset и сдвигает
+    session.offset; возвращает новое смещение.
+
+    Проверка смещения, запись и сдвиг идут под исключительной блокировкой
+    файла сессии: параллельная часть сразу получает ChunkConflict, а не
+    пишет в файл вперемешку и не ждёт чужую передачу. При обрыве
+    соединения принимается то, что успело прийти, и клиент продолжит с
+    этого смещения.
+    """
+    path = session_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(descriptor, 'r+b') as part:
+        if not _try_lock(part):
+            raise ChunkConflict
+        try:
+            session.refresh_from_db(fields=['offset'])
+            if session.offset != offset:
+                raise ChunkConflict
+            session.offset = _append(part, stream, offset, length)
+            session.save(update_fields=['offset'])
+        finally:
+            locks.unlock(part)
+    return session.offset
+
+
+def _try_lock(part):
+    # Результат locks.lock не смотрим: в Django 2.2 он ложен и при
+    # успехе. Занятый файл с LOCK_NB поднимает BlockingIOError.
+    try:
+        locks.lock(part, locks.LOCK_EX | locks.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _append(part, stream, offset, length):
+    """Копирует тело по READ_SIZE байт в part с offset; возвращает конец
+    записанного."""
+    part.seek(offset)
+    remaining = length
+    try:
+        while remaining:
+            data = stream.read(min(remaining, READ_SIZE))
+            if not data:
+                break
+            part.write(data)
+            remaining -= len(data)
+    except OSError:
+        # Клиент оборвал соединение: сохраняем то, что успело прийти.
+        pass
+    # Хвост от прошлой оборванной попытки больше не нужен.
+    part.truncate()
+    return part.tell()
+
+
+def open_session(session):
+    """Файл сессии как загрузка для PostForm; закрыть после сохранения."""
+    return SessionFile(
+        open(session_path(session), 'rb'),
+        session.filename,
+        None,
+        session.size,
+    )
+
+
+def finish_session(session):
+    """Удаляет сессию и её файл, если хранилище его не забрало."""
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
@@ -8,9 +8,41 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('search/', views.post_search, name='search'),
+    path(
+        'autocomplete/',
+        views.post_autocomplete,
+        name='autocomplete'
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('create/', views.post_create, name='create'),
+    path(
+        'images/<int:width>/<path:name>',
+        views.post_image,
+        name='post_image'
+    ),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path(
+        'uploads/<uuid:session_id>/',
+        views.upload_session,
+        name='upload_session'
+    ),
+    path(
+        'uploads/<uuid:session_id>/commit/',
+        views.upload_commit,
+        name='upload_commit'
+    ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path(
+        'posts/<int:post_id>/comments/stream/',
+        views.comment_stream,
+        name='comment_stream'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -1,35 +1,66 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.http import (FileResponse, Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.datastructures import MultiValueDict
+from django.views.decorators.http import require_http_methods, require_POST
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from . import autocomplete, events, search
+from .caching import add_cache_tags, cache_tagged, page_tags
+from .conditional import (conditional, group_validators, index_validators,
+                          post_validators, profile_validators)
+from .forms import CommentForm, PostForm, UploadSessionForm
+from .feed import FollowFeedPaginator
+from .models import Comment, Follow, Group, Post, UploadSession, User
+from .paginators import CursorPaginator
+from .stats import user_stats
+from .thumbnails import MIME_TYPES, negotiate, variant
+from .uploads import (ChunkConflict, finish_session, open_session,
+                      request_files, write_chunk)
 
 AMOUNT_POSTS_IN_PAGE = 10
+COMMENTS_IN_PAGE = 20
 
 
 def paginator_my(request, post_list):
-    paginator = Paginator(post_list, AMOUNT_POSTS_IN_PAGE)
+    # Старые ссылки вида ?page=N продолжают работать через OFFSET,
+    # все остальные запросы листаются курсорами ?after=/?before=.
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        paginator = Paginator(post_list, AMOUNT_POSTS_IN_PAGE)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(
+        post_list,
+        AMOUNT_POSTS_IN_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return paginator.get_page()
 
 
-@cache_page(20, key_prefix="index_page")
+@conditional(index_validators)
+@cache_tagged()
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.feed()
     page_obj = paginator_my(request, post_list)
+    add_cache_tags(request, 'posts', *page_tags(page_obj))
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional(group_validators)
+@cache_tagged()
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.feed()
     page_obj = paginator_my(request, posts)
+    add_cache_tags(request, f'group:{group.pk}', *page_tags(page_obj))
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -37,10 +68,12 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(profile_validators)
+@cache_tagged()
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=author)
-    count = author.posts.count()
+    posts = Post.objects.feed().filter(author=author)
+    count = user_stats(author.pk).posts_count
     page_obj = paginator_my(request, posts)
     following = (
         request.user.is_authenticated
@@ -48,6 +81,7 @@ def profile(request, username):
             user=request.user,
             author=author
         ))
+    add_cache_tags(request, f'author:{author.pk}', *page_tags(page_obj))
     context = {
         'count': count,
         'author': author,
@@ -57,14 +91,53 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+def comments_page(request, post_id):
+    """Страница комментариев поста от старых к новым за курсором ?after=.
+
+    Авторы приходят тем же запросом, а страница стоит одинаково при
+    любом числе комментариев.
+    """
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).with_authors(),
+        COMMENTS_IN_PAGE,
+        after=request.GET.get('after'),
+        key='created',
+    )
+    return paginator.get_page()
+
+
+def post_search(request):
+    """Посты по полнотекстовому запросу ?q=, от самых релевантных."""
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(search.search(query), AMOUNT_POSTS_IN_PAGE)
+    return render(request, 'posts/search.html', {
+        'query': query,
+        'page_obj': paginator.get_page(request.GET.get('page')),
+    })
+
+
+def post_autocomplete(request):
+    """Подсказки авторов и групп для префикса ?q= из памяти процесса."""
+    return JsonResponse(
+        {'results': autocomplete.suggest(request.GET.get('q', ''))}
+    )
+
+
+@conditional(post_validators)
 def post_detail(request, post_id):
-    individual_post = get_object_or_404(Post, id=post_id)
-    comments = individual_post.comments.all()
+    individual_post = get_object_or_404(Post.objects.feed(), id=post_id)
+    comments = comments_page(request, post_id)
     form = CommentForm(request.POST or None)
     context = {
         'individual_post': individual_post,
+        'author_stats': user_stats(individual_post.author_id),
         'comments': comments,
         'form': form,
+        # Поток новых комментариев продолжится после последнего из них.
+        'last_comment_id': (
+            events.latest_id(post_id) if individual_post.comments_count
+            else 0
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
@@ -73,7 +146,7 @@ def post_detail(request, post_id):
 def post_create(request):
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None
+        files=request_files(request)
     )
     if not form.is_valid():
         return render(
@@ -90,17 +163,17 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if request.user != post.author:
+    if request.user.pk != post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None,
+        files=request_files(request),
         instance=post
     )
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        post.save(update_fields=Post.EDIT_FIELDS)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html', {
         'form': form,
@@ -108,6 +181,47 @@ def post_edit(request, post_id):
     })
 
 
+@conditional(post_validators)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для подгрузки на странице поста."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    return render(request, 'posts/includes/comments.html', {
+        'post_id': post_id,
+        'comments': comments_page(request, post_id),
+    })
+
+
+def comment_stream(request, post_id):
+    """Новые комментарии поста потоком Server-Sent Events.
+
+    Поток начинается после Last-Event-ID (или ?last_event_id=, который
+    страница поста берёт из последнего комментария на момент рендера), а
+    без него — с комментариев, созданных после подключения.
+    """
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    last_seen = request.META.get(
+        'HTTP_LAST_EVENT_ID', request.GET.get('last_event_id')
+    )
+    try:
+        last_seen = int(last_seen)
+    except (TypeError, ValueError):
+        last_seen = events.latest_id(post_id)
+    if not events.acquire():
+        response = HttpResponse(status=503)
+        response['Retry-After'] = events.RETRY_MS // 1000
+        return response
+    response = StreamingHttpResponse(
+        events.CommentStream(post_id, last_seen),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен копить поток в буфере.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -122,10 +236,18 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list_follow = Post.objects.filter(
-        author__following__user=request.user,
-    )
-    page_obj = paginator_my(request, post_list_follow)
+    if request.GET.get('page') is not None:
+        post_list_follow = Post.objects.feed().filter(
+            author__following__user=request.user,
+        )
+        page_obj = paginator_my(request, post_list_follow)
+    else:
+        page_obj = FollowFeedPaginator(
+            request.user,
+            AMOUNT_POSTS_IN_PAGE,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        ).get_page()
     context = {
         'page_obj': page_obj,
     }
@@ -152,3 +274,108 @@ def profile_unfollow(request, username):
         author=author
     ).delete()
     return redirect('posts:profile', author)
+
+
+def post_image(request, width, name):
+    """Вариант картинки поста нужной ширины в лучшем формате из Accept."""
+    if width not in settings.POST_IMAGE_WIDTHS:
+        raise Http404
+    image_format = negotiate(request.META.get('HTTP_ACCEPT', ''))
+    thumbnail = variant(name, width, image_format)
+    if thumbnail is None or not thumbnail.exists():
+        raise Http404
+    response = FileResponse(
+        thumbnail.storage.open(thumbnail.name),
+        content_type=MIME_TYPES[image_format],
+    )
+    patch_vary_headers(response, ['Accept'])
+    patch_cache_control(
+        response, public=True, max_age=settings.POST_IMAGE_MAX_AGE
+    )
+    return response
+
+
+def upload_state(session, status=200):
+    return JsonResponse(
+        {'id': session.pk, 'offset': session.offset, 'size': session.size},
+        status=status,
+    )
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Открывает сессию загрузки картинки по частям."""
+    form = UploadSessionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    session = form.save(commit=False)
+    session.user = request.user
+    session.save()
+    return upload_state(session, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def upload_session(request, session_id):
+    """Смещение сессии (GET), следующая часть (PATCH) или отмена (DELETE).
+
+    Часть приходит телом PATCH с заголовком Upload-Offset; смещение,
+    которое не совпало с принятым, — 409 с текущим состоянием, по нему
+    клиент продолжает загрузку.
+    """
+    session = get_object_or_404(
+        UploadSession.objects.active(), pk=session_id, user=request.user
+    )
+    if request.method == 'DELETE':
+        finish_session(session)
+        return HttpResponse(status=204)
+    if request.method != 'PATCH':
+        return upload_state(session)
+    try:
+        offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+        length = int(request.META['CONTENT_LENGTH'])
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {'errors': 'Нужны заголовки Upload-Offset и Content-Length.'},
+            status=400,
+        )
+    if offset != session.offset:
+        return upload_state(session, status=409)
+    if (length > settings.UPLOAD_CHUNK_MAX_BYTES
+            or offset + length > session.size):
+        return upload_state(session, status=413)
+    try:
+        write_chunk(session, request, offset, length)
+    except ChunkConflict:
+        session.refresh_from_db()
+        return upload_state(session, status=409)
+    return upload_state(session)
+
+
+@login_required
+@require_POST
+def upload_commit(request, session_id):
+    """Создаёт пост с загруженной картинкой через PostForm."""
+    session = get_object_or_404(
+        UploadSession.objects.active(), pk=session_id, user=request.user
+    )
+    if session.offset < session.size:
+        return upload_state(session, status=409)
+    with open_session(session) as image:
+        form = PostForm(
+            request.POST, files=MultiValueDict({'image': [image]})
+        )
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        post = form.save(commit=False)
+        post.author = request.user
+        post.save()
+    finish_session(session)
+    return JsonResponse(
+        {
+            'id': post.pk,
+            'url': reverse('posts:post_detail', args=(post.pk,)),
+        },
+        status=201,
+    )
@@ -146,9 +146,108 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
+# Файлы картинок, изменённые меньше MEDIA_GRACE_PERIOD секунд назад, не
+# удаляются: пост со ссылкой на них может быть ещё не закоммичен.
+MEDIA_GRACE_PERIOD = 60 * 60
+
+# Загрузки всегда пишутся во временные файлы и не дальше
+# POST_IMAGE_MAX_BYTES. Картинки больше POST_IMAGE_MAX_PIXELS отклоняются
+# по заголовку, длиннее POST_IMAGE_MAX_SIDE уменьшаются при загрузке.
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedUploadHandler']
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 25 * 10 ** 6
+POST_IMAGE_MAX_SIDE = 2560
+# Загрузка по частям: файлы сессий лежат в MEDIA_ROOT/UPLOAD_SESSIONS_DIR,
+# часть не больше UPLOAD_CHUNK_MAX_BYTES, незавершённая сессия живёт
+# UPLOAD_SESSION_TTL секунд.
+UPLOAD_SESSIONS_DIR = 'uploads'
+UPLOAD_CHUNK_MAX_BYTES = 2 * 1024 * 1024
+UPLOAD_SESSION_TTL = 60 * 60 * 24
+
+# Сколько потоков обслуживает запросы в одном процессе сервера
+# (gunicorn --threads); задаётся переменной окружения при запуске.
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', 4))
+# Поток новых комментариев (SSE) держит поток сервера целиком, поэтому
+# таких потоков не больше четверти SERVER_THREADS на процесс, но хотя бы
+# один; предел можно задать и прямо переменной COMMENT_STREAMS_MAX.
+# Пустое сообщение уходит раз в COMMENT_STREAM_HEARTBEAT секунд тишины,
+# через COMMENT_STREAM_TIMEOUT секунд поток закрывается и браузер
+# переподключается с Last-Event-ID.
+COMMENT_STREAMS_MAX = int(
+    os.getenv('COMMENT_STREAMS_MAX', max(1, SERVER_THREADS // 4))
+)
+COMMENT_STREAM_HEARTBEAT = 15
+COMMENT_STREAM_TIMEOUT = 60 * 5
+
+# Автодополнение авторов и групп: в памяти каждого процесса по
+# AUTOCOMPLETE_SIZE самых активных авторов и групп, в ответе не больше
+# AUTOCOMPLETE_LIMIT подсказок; число постов освежается полной
+# перестройкой раз в AUTOCOMPLETE_TTL секунд.
+AUTOCOMPLETE_SIZE = 50000
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_TTL = 60 * 10
+
+# Списки больших таблиц в админке не считают строки точно: без фильтров
+# число берётся из статистики базы, с фильтрами считается не дальше
+# ESTIMATED_COUNT_LIMIT строк, а глубже ходят по курсору «Дальше».
+ESTIMATED_COUNT_LIMIT = 10000
+
+# Кэш общий для всех процессов сервера: версии тегов, страницы,
+# блокировки пересчёта и счётчики лежат в файлах, поэтому запись в одном
+# воркере сразу видят остальные. add и incr атомарны между процессами
+# (posts.filecache). Если серверов несколько, сюда подставляется
+# memcached или redis.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'posts.filecache.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
+
+# Тесты получают свой кэш во временном каталоге (yatube.test_runner).
+TEST_RUNNER = 'yatube.test_runner.TempCacheRunner'
+
+# Авторы, у которых подписчиков не меньше порога, не раскладываются
+# в ленты подписчиков, а подмешиваются при чтении «Избранных авторов».
+FEED_CELEBRITY_THRESHOLD = 10000
+# Сколько последних постов бывшей знаменитости догоняется в ленту
+# каждого подписчика: догон идёт прямо в запросе отписки.
+FEED_FAN_OUT_POSTS = 200
+
+# Кэш страниц лент с инвалидацией по тегам. Свежесть обеспечивают теги;
+# после SOFT_TTL страница пересчитывается одним воркером, пока остальные
+# отдают старую копию, после HARD_TTL копия удаляется из кэша.
+TAGGED_CACHE_SOFT_TTL = 60 * 60
+TAGGED_CACHE_HARD_TTL = 60 * 60 * 6
+# Сколько секунд держится блокировка пересчёта, если воркер упал.
+TAGGED_CACHE_LOCK_TIMEOUT = 30
+
+# Геометрии {% thumbnail %} из шаблонов постов: миниатюры для них строятся
+# в фоне после сохранения поста. Параметры должны совпадать с шаблонами,
+# иначе sorl не узнает готовый файл.
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+# Ширины вариантов картинки поста для srcset и форматы вариантов в порядке
+# предпочтения; последний — запасной для браузеров без поддержки прочих.
+# Форматы, которые не умеет кодировать Pillow, пропускаются.
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+# Сколько секунд браузеры и прокси могут хранить варианты картинок.
+POST_IMAGE_MAX_AGE = 60 * 60 * 24
+# Ширина превью картинки в пикселях, встраиваемого в карточку ленты.
+POST_PLACEHOLDER_WIDTH = 16
+# Размер пула потоков для миниатюр; 0 — строить сразу в вызывающем потоке.
+THUMBNAIL_WORKERS = 2
+
+# Метаданные миниатюр хранятся в общей таблице sorl, перед ней в каждом
+# процессе стоит LRU на THUMBNAIL_LRU_SIZE записей, живущих
+# THUMBNAIL_LRU_TIMEOUT секунд. При первом обращении процесс подгружает
+# миниатюры THUMBNAIL_WARM_UP свежих постов.
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# Бэкенд sorl, который называет миниатюру, не строя её (posts.backend).
+THUMBNAIL_BACKEND = 'posts.backend.ThumbnailBackend'
+THUMBNAIL_LRU_SIZE = 10000
+THUMBNAIL_LRU_TIMEOUT = 60 * 5
+THUMBNAIL_WARM_UP = 200
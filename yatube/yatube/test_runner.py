@@ -0,0 +1,34 @@
+"""Запуск тестов с кэшем во временном каталоге.
+
+Рабочий кэш (CACHES) лежит в BASE_DIR/cache и общий для всех процессов
+сервера. Тесты чистят кэш через cache.clear(): в рабочем каталоге они
+стирали бы кэш запущенного рядом сервера и оставляли бы свои файлы.
+"""
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def temp_cache_settings():
+    """override_settings с копией CACHES в новом временном каталоге."""
+    location = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = {
+        alias: dict(options, LOCATION=location)
+        for alias, options in settings.CACHES.items()
+    }
+    return override_settings(CACHES=caches), location
+
+
+class TempCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_settings, self._cache_location = temp_cache_settings()
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_location, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)